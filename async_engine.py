@@ -0,0 +1,305 @@
+import os
+import re
+import asyncio
+import cloudscraper
+import aiohttp
+import rate_limiter
+import retry
+import page_cache
+import clearance
+import bandwidth
+import downloads
+import zip_check
+import link_extract
+import library
+from bs4 import BeautifulSoup
+
+# --- CONFIGURATION ---
+START_YEAR = 1952
+END_YEAR = 2026
+SITE_URL = "https://www.masstamilan.dev"
+ROOT_DOWNLOAD_FOLDER = r"/mnt/storage/music"
+MAX_PAGE_FETCHES = 200      # Page requests allowed in flight at once
+MAX_DOWNLOADS = 32          # Streaming file downloads allowed in flight at once
+MAX_YEARS_AT_ONCE = 8       # Years being discovered at the same time
+POOL_SIZE = 256             # Total keep-alive connections in the client pool
+POOL_SIZE_PER_HOST = 64
+KEEPALIVE_SECONDS = 60
+PAGE_TIMEOUT = 15
+CHUNK_SIZE = 1024 * 1024
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Referer": "https://www.google.com/",
+}
+
+YEARS_TO_DOWNLOAD = [str(y) for y in range(START_YEAR, END_YEAR + 1)]
+LIBRARY = library.Library()
+# aiohttp's dropped connections and cut-off bodies are as transient as requests' are
+retry.add_retryable(aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+# --- ENGINE ---
+
+class AsyncFetchEngine:
+    """Pooled aiohttp client with the same get_soup / download_movie_content
+    contract as the threaded scripts, but with bounded concurrency."""
+
+    def __init__(self, max_pages=MAX_PAGE_FETCHES, max_downloads=MAX_DOWNLOADS):
+        self.max_pages = max_pages
+        self.max_downloads = max_downloads
+        self.session = None
+        self._page_slots = None
+        self._download_slots = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=POOL_SIZE,
+            limit_per_host=POOL_SIZE_PER_HOST,
+            keepalive_timeout=KEEPALIVE_SECONDS,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            cookies=await asyncio.to_thread(warm_up_cookies),
+        )
+        self._page_slots = asyncio.Semaphore(self.max_pages)
+        self._download_slots = asyncio.Semaphore(self.max_downloads)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def get_soup(self, url):
+        html = await self.get_html(url)
+        if html is None:
+            return None
+        return await asyncio.to_thread(BeautifulSoup, html, 'html.parser')
+
+    async def get_html(self, url):
+        """Page HTML, or None when the page doesn't exist (404). 429/5xx, timeouts and
+        dropped connections are retried with backoff; anything else raises, so a
+        listing walk can't mistake it for its end."""
+        async def attempt():
+            await rate_limiter.async_acquire(url)
+            timeout = aiohttp.ClientTimeout(total=PAGE_TIMEOUT)
+            async with self.session.get(url, timeout=timeout) as response:
+                if response.status == 404:
+                    return None
+                if response.status in retry.RETRYABLE_STATUSES:
+                    response.raise_for_status()  # Retried by async_call
+                if response.status != 200:
+                    raise page_cache.PageUnavailable(url, response.status)
+                return await response.text()
+
+        async with self._page_slots:
+            return await retry.async_call(url, attempt)
+
+    async def resolve_download_link(self, movie_url):
+        """Streams the movie page and stops reading at the zip320 anchor.
+        Returns (link, "zip"|"mp3"), (None, "") or None if the page failed."""
+        async def attempt():
+            await rate_limiter.async_acquire(movie_url)
+            timeout = aiohttp.ClientTimeout(total=PAGE_TIMEOUT)
+            async with self.session.get(movie_url, timeout=timeout) as response:
+                if response.status in retry.RETRYABLE_STATUSES:
+                    response.raise_for_status()  # Retried by async_call
+                if response.status != 200:
+                    return None
+                encoding = link_extract.declared_encoding(response.headers.get("Content-Type"))
+                stream = link_extract.DownloadLinkStream(movie_url, encoding)
+                async for chunk in response.content.iter_chunked(16 * 1024):
+                    if stream.feed(chunk):
+                        # Drop the connection instead of draining the rest of the page
+                        response.close()
+                        break
+                return stream.result()
+
+        async with self._page_slots:
+            try:
+                return await retry.async_call(movie_url, attempt)
+            except Exception as e:
+                print(f"      [!] Couldn't load {movie_url}: {e}")
+                return None
+
+    async def download_movie_content(self, movie_url, year_path):
+        resolved = await self.resolve_download_link(movie_url)
+        if not resolved: return False
+
+        target_link, file_type = resolved
+        if not target_link: return False
+
+        ext = ".zip" if file_type == "zip" else ".mp3"
+        filename = f"{movie_filename_stem(movie_url)}_320kbps{ext}"
+        save_path = os.path.join(year_path, filename)
+
+        if LIBRARY.has(save_path):
+            print(f"      [-] Skipping: {filename}")
+            return True
+
+        async with self._download_slots:
+            try:
+                print(f"      [*] Downloading {filename}...")
+                async def attempt():
+                    await rate_limiter.async_acquire(target_link, "download")
+                    return await self.stream_to_file(target_link, save_path)
+                await retry.async_call(target_link, attempt)
+                LIBRARY.add(save_path)
+                print(f"      [SUCCESS] Finished {filename}")
+                return True
+            except Exception as e:
+                print(f"      [!] Failed {filename}: {e}")
+                return False
+
+    async def stream_to_file(self, url, save_path):
+        """Async twin of downloads.download_file: .part file, Range resume, atomic rename."""
+        part_path = downloads.part_path_for(save_path)
+        headers, offset = downloads.resume_headers({}, part_path, downloads.resume_offset(part_path))
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+
+        async with self.session.get(url, headers=headers, timeout=timeout) as r:
+            if offset and r.status == 416:
+                if downloads.total_from_content_range(r.headers.get("Content-Range")) == offset:
+                    verifier = await asyncio.to_thread(downloads.start_checks, save_path, part_path, offset)
+                    downloads.finish_zip_check(verifier, part_path, offset)
+                    downloads.promote(part_path, save_path)
+                    return offset
+                os.remove(part_path)
+                return await self.stream_to_file(url, save_path)
+            r.raise_for_status()
+
+            if r.status == 206:
+                expected = downloads.total_from_content_range(r.headers.get("Content-Range"))
+                mode = 'ab'
+            else:
+                offset = 0
+                expected = r.content_length
+                mode = 'wb'
+                downloads.save_validator(part_path, downloads.validator_from(r.headers))
+
+            verifier = await asyncio.to_thread(downloads.start_checks, save_path, part_path, offset)
+
+            def write(f, chunk):
+                # Runs on a worker thread, so waiting out the bandwidth cap doesn't stall the loop
+                bandwidth.consume(len(chunk))
+                if verifier: verifier.feed(chunk)
+                f.write(chunk)
+
+            written = offset
+            try:
+                with open(part_path, mode) as f:
+                    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                        await asyncio.to_thread(write, f, chunk)
+                        written += len(chunk)
+            except zip_check.CorruptZip:
+                os.remove(part_path)
+                raise
+
+        if expected is not None and written != expected:
+            raise downloads.IncompleteDownload(f"incomplete download: {written} of {expected} bytes")
+        downloads.finish_zip_check(verifier, part_path, expected)
+        downloads.promote(part_path, save_path)
+        return written
+
+# --- HELPER FUNCTIONS ---
+
+def warm_up_cookies():
+    """Hands aiohttp the anti-bot clearance cookies, solved by cloudscraper only when
+    the shared clearance cache has none that are still valid."""
+    scraper = cloudscraper.create_scraper()
+    clearance.prepare(scraper, SITE_URL, HEADERS, timeout=PAGE_TIMEOUT)
+    return scraper.cookies.get_dict()
+
+def movie_filename_stem(movie_url):
+    base_name = movie_url.split('/')[-1].split('?')[0]
+    return re.sub(r'[\\/*?:"<>|]', "", base_name).replace("-", "_")
+
+# --- CORE LOGIC ---
+
+async def process_movie(engine, movie_info, mode, current_save_path):
+    movie_url, title = movie_info
+    if mode == "test":
+        return f"Movie: {title} | URL: {movie_url}"
+    success = await engine.download_movie_content(movie_url, current_save_path)
+    status = "SUCCESS" if success else "FAILED"
+    return f"[{status}] Movie: {title} | URL: {movie_url}"
+
+async def process_single_year(engine, year, mode, year_slots):
+    """Walks one year's listing and schedules every movie without waiting on downloads."""
+    year_base_url = f"{SITE_URL}/browse-by-year/{year}"
+    if mode == "test":
+        current_save_path = os.path.join(ROOT_DOWNLOAD_FOLDER, "test_reports")
+    else:
+        current_save_path = os.path.join(ROOT_DOWNLOAD_FOLDER, year)
+    os.makedirs(current_save_path, exist_ok=True)
+
+    current_page = 1
+    global_seen_urls = set()
+    movie_tasks = []
+    listing_error = None
+
+    async with year_slots:
+        print(f"\n>>> STARTED PROCESSING YEAR: {year} <<<")
+        try:
+            while True:
+                page_url = f"{year_base_url}?page={current_page}"
+                html = await engine.get_html(page_url)
+                if html is None: break
+
+                links, _ = await asyncio.to_thread(link_extract.extract_listing, html, page_url)
+                page_movies = []
+                for full_url, text in links or []:
+                    if full_url not in global_seen_urls:
+                        page_movies.append((full_url, text))
+                        global_seen_urls.add(full_url)
+                if not page_movies: break
+
+                for movie in page_movies:
+                    movie_tasks.append(asyncio.create_task(
+                        process_movie(engine, movie, mode, current_save_path)))
+                current_page += 1
+        except Exception as e:
+            # Not the end of the list; the movies already scheduled still finish below
+            listing_error = e
+
+    report_data = await asyncio.gather(*movie_tasks)
+
+    report_name = f"verified_list_{year}.txt" if mode == "test" else f"download_report_{year}.txt"
+    final_report_path = os.path.join(current_save_path, report_name)
+    with open(final_report_path, "w", encoding="utf-8") as f:
+        f.write(f"--- {mode.upper()} REPORT FOR {year} ---\n")
+        f.write(f"Total Movies Found: {len(report_data)}\n")
+        if listing_error:
+            f.write(f"INCOMPLETE: listing stopped at page {current_page}: {listing_error}\n")
+        f.write("\n")
+        f.write("\n".join(report_data))
+
+    if listing_error:
+        raise listing_error
+    return f"Year {year} complete. Movies: {len(report_data)}"
+
+async def run_async_sweep(mode="test", years=None):
+    years = years or YEARS_TO_DOWNLOAD
+    print(f"Starting Async Scrape (Mode: {mode})")
+    print(f"Pages in flight: {MAX_PAGE_FETCHES} | Downloads in flight: {MAX_DOWNLOADS}")
+
+    year_slots = asyncio.Semaphore(MAX_YEARS_AT_ONCE)
+    LIBRARY.reset()
+    async with AsyncFetchEngine() as engine:
+        tasks = [process_single_year(engine, year, mode, year_slots) for year in years]
+        for year, result in zip(years, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                print(f"ERROR processing year {year}: {result}")
+            else:
+                print(f"FINISH: {result}")
+
+if __name__ == "__main__":
+    # Use "prod" to download, "test" to just list
+    asyncio.run(run_async_sweep(mode="prod"))
@@ -0,0 +1,123 @@
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+QUANTUM = 256 * 1024       # Largest read between two checks while a cap is active
+BURST_SECONDS = 0.5        # Idle time that may be spent as a burst afterwards
+
+# --- LIMITER ---
+
+class BandwidthLimiter:
+    """Global bytes/sec budget shared by every download stream.
+
+    Streams call consume(flow, n) after reading n bytes. While the cap is
+    reached, waiting streams are released in weighted fair queueing order: each
+    flow (a year, a job) gets a share of the budget in proportion to its weight,
+    whatever the number of streams it has open, and an idle flow doesn't save up
+    credit. The rate can be changed at any time, directly or by an hourly
+    schedule."""
+
+    def __init__(self, rate=0):
+        self.base_rate = rate
+        self.schedule = []
+        self.weights = {}
+        self.finish_tags = {}
+        self.virtual_time = 0.0
+        self.tokens = 0.0
+        self.refilled_at = time.monotonic()
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def rate(self):
+        """Bytes/sec allowed right now; 0 means unlimited."""
+        hour = time.localtime().tm_hour
+        for start, end, rate in self.schedule:
+            # (22, 6, ...) wraps past midnight
+            if (start <= hour < end) if start <= end else (hour >= start or hour < end):
+                return rate
+        return self.base_rate
+
+    def set_rate(self, rate):
+        with self.condition:
+            self.base_rate = rate
+            self.condition.notify_all()
+
+    def set_schedule(self, schedule):
+        """[(start_hour, end_hour, bytes_per_sec), ...]; outside them set_rate's value applies."""
+        with self.condition:
+            self.schedule = list(schedule)
+            self.condition.notify_all()
+
+    def set_weight(self, flow, weight):
+        with self.condition:
+            self.weights[flow] = weight
+
+    def _refill(self, rate):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.refilled_at) * rate, rate * BURST_SECONDS)
+        self.refilled_at = now
+
+    def consume(self, flow, num_bytes):
+        rate = self.rate()
+        if rate <= 0 or num_bytes <= 0:
+            return
+        with self.condition:
+            # Start-time fair queueing: served in order of start tags, so a flow's
+            # share doesn't depend on the rate, which may change under it
+            start = max(self.virtual_time, self.finish_tags.get(flow, 0.0))
+            self.finish_tags[flow] = start + num_bytes / self.weights.get(flow, 1.0)
+            entry = (start, next(self.sequence))
+            heapq.heappush(self.waiting, entry)
+            while True:
+                rate = self.rate()
+                if rate <= 0:
+                    break
+                self._refill(rate)
+                if self.waiting[0] == entry and self.tokens >= 0:
+                    # Bytes already read are paid for even if it takes the balance negative
+                    self.tokens -= num_bytes
+                    break
+                delay = -self.tokens / rate if self.tokens < 0 else 0.05
+                self.condition.wait(max(delay, 0.001))
+            self.waiting.remove(entry)
+            heapq.heapify(self.waiting)
+            self.virtual_time = max(self.virtual_time, start)
+            self.condition.notify_all()
+
+LIMITER = BandwidthLimiter()
+_flows = threading.local()
+
+# --- HELPER FUNCTIONS ---
+
+def set_rate(rate):
+    LIMITER.set_rate(rate)
+
+def set_schedule(schedule):
+    LIMITER.set_schedule(schedule)
+
+def set_weight(flow, weight):
+    LIMITER.set_weight(flow, weight)
+
+def current_flow():
+    return getattr(_flows, "name", None)
+
+@contextmanager
+def flow(name):
+    """Bytes read by this thread inside the block are accounted to flow `name`."""
+    previous = current_flow()
+    _flows.name = name
+    try:
+        yield
+    finally:
+        _flows.name = previous
+
+def read_size(room):
+    """How much a stream may read at once: small steps while a cap is active."""
+    return min(room, QUANTUM) if LIMITER.rate() > 0 else room
+
+def consume(num_bytes):
+    LIMITER.consume(current_flow(), num_bytes)
@@ -0,0 +1,306 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- CONFIGURATION ---
+SCENARIOS = ["perfection1", "perfection2", "multi_year", "async_engine"]
+DEFAULTS = {
+    "years": 2,
+    "pages": 3,             # Listing pages per year
+    "movies": 20,           # Movies per listing page
+    "payload_kb": 512,      # Size of each album zip
+    "latency_ms": 20,       # Added before every response
+    "conn_kbps": 0,         # Per-connection payload speed cap, 0 = unlimited
+    "filler_kb": 64,        # Extra markup on every page, to make parsing realistic
+}
+FIRST_YEAR = 2001
+
+# --- MOCK SITE ---
+
+def build_payload(size):
+    """A valid stored zip of roughly `size` bytes, so zip checks downstream pass."""
+    rng = random.Random(size)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as z:
+        track = 0
+        while buffer.tell() < size:
+            chunk = min(256 * 1024, max(1, size - buffer.tell()))
+            z.writestr(f"track_{track:02d}.mp3", rng.randbytes(chunk))
+            track += 1
+    return buffer.getvalue()
+
+def filler(kb):
+    block = "<div class='side'><p>Trending songs and other filler markup</p><span>x</span></div>\n"
+    return block * max(0, kb * 1024 // len(block))
+
+class MockSite:
+    """Generated browse-by-year grids, movie pages and zip payloads."""
+
+    def __init__(self, options):
+        self.options = options
+        self.payload = build_payload(options["payload_kb"] * 1024)
+        self.filler = filler(options["filler_kb"])
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {"listing": 0, "movie": 0, "payload": 0, "other": 0}
+            self.bytes_sent = 0
+
+    def count(self, kind, num_bytes=0):
+        with self.lock:
+            self.counts[kind] += 1
+            self.bytes_sent += num_bytes
+
+    def add_bytes(self, num_bytes):
+        with self.lock:
+            self.bytes_sent += num_bytes
+
+    def listing_page(self, year, page):
+        movies = self.options["movies"]
+        blocks = "".join(
+            f"<div class='a-i'><a href='/movie-{year}-{page}-{i}-songs'>"
+            f"<h2>Movie {year} {page} {i}</h2><p>Starring: Someone</p><p>Music: Someone</p></a></div>"
+            for i in range(movies))
+        pages = "".join(f"<a href='/browse-by-year/{year}?page={p}'>{p}</a>"
+                        for p in range(1, self.options["pages"] + 1))
+        return (f"<html><body><nav><a href='/browse-by-year/{year}'>{year}</a></nav>"
+                f"<div class='gw'>{blocks}</div><ul class='pagination'>{pages}</ul>"
+                f"{self.filler}</body></html>")
+
+    def movie_page(self, slug):
+        tracks = "".join(f"<li><a href='/d320/{slug}/{t}'>Track {t}</a></li>" for t in range(8))
+        return (f"<html><body><h1>{slug}</h1><ul>{tracks}</ul>"
+                f"<a class='dl' href='/zip320/{slug}'>Download zip 320kbps</a>"
+                f"{self.filler}</body></html>")
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_html(self, kind, html):
+            body = html.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            site.count(kind, len(body))
+
+        def send_payload(self, head_only=False):
+            data = site.payload
+            start, end, status = 0, len(data) - 1, 200
+            rng = self.headers.get("Range")
+            if rng and rng.startswith("bytes="):
+                first, _, last = rng[6:].partition("-")
+                start = int(first or 0)
+                end = min(int(last), end) if last else end
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(data)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            self.send_response(status)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Accept-Ranges", "bytes")
+            # One ETag per album URL, so dedup can't skip the downloads being measured
+            self.send_header("ETag", f'"{abs(hash(self.path)):x}"')
+            self.send_header("Content-Length", str(end - start + 1))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            self.end_headers()
+            if head_only:
+                return
+            site.count("payload")
+            view = memoryview(data)[start:end + 1]
+            step = 64 * 1024
+            cap = site.options["conn_kbps"] * 1024
+            for offset in range(0, len(view), step):
+                piece = view[offset:offset + step]
+                self.wfile.write(piece)
+                site.add_bytes(len(piece))
+                if cap:
+                    time.sleep(len(piece) / cap)
+
+        def route(self, head_only=False):
+            time.sleep(site.options["latency_ms"] / 1000)
+            parts = urlsplit(self.path)
+            path = parts.path
+            try:
+                if path.startswith("/zip320/") or path.startswith("/d320/"):
+                    return self.send_payload(head_only)
+                if path.startswith("/browse-by-year/"):
+                    year = int(path.rsplit("/", 1)[1])
+                    page = int(parse_qs(parts.query).get("page", ["1"])[0])
+                    last_year = FIRST_YEAR + site.options["years"] - 1
+                    if FIRST_YEAR <= year <= last_year and 1 <= page <= site.options["pages"]:
+                        return self.send_html("listing", site.listing_page(year, page))
+                elif path.endswith("-songs"):
+                    return self.send_html("movie", site.movie_page(path.strip("/")))
+                elif path == "/":
+                    return self.send_html("other", "<html><body>home</body></html>")
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_GET(self):
+            self.route()
+
+        def do_HEAD(self):
+            self.route(head_only=True)
+
+    return Handler
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Early-exit link scans drop connections on purpose
+        pass
+
+# --- SCENARIOS (run in a child process so peak RSS is per scenario) ---
+
+def prepare_module(module, site_url, workdir, years):
+    import rate_limiter
+    import page_cache
+    import clearance
+    module.SITE_URL = site_url
+    module.ROOT_DOWNLOAD_FOLDER = workdir
+    module.YEARS_TO_DOWNLOAD = years
+    if hasattr(module, "STATE_DB_PATH"):
+        module.STATE_DB_PATH = os.path.join(workdir, "crawl_state.sqlite3")
+    clearance.CACHE_PATH = os.path.join(workdir, "clearance.json")
+    if hasattr(module, "PAGE_CACHE"):
+        module.PAGE_CACHE = page_cache.PageCache(os.path.join(workdir, ".page_cache"))
+    # Pacing is a politeness setting for the real site; the mock measures raw throughput.
+    # The scripts apply their own budgets when a run starts, async_engine uses the defaults
+    for name in ("PAGE_REQUESTS_PER_SEC", "PAGE_BURST", "DOWNLOADS_PER_SEC", "DOWNLOAD_BURST",
+                 "PROBES_PER_SEC", "PROBE_BURST"):
+        if hasattr(module, name):
+            setattr(module, name, 1e6)
+    rate_limiter.set_budget("page", 1e6, 1e6)
+    rate_limiter.set_budget("download", 1e6, 1e6)
+    rate_limiter.set_budget("probe", 1e6, 1e6)
+
+def run_scenario(name, site_url, workdir, years):
+    if name == "perfection1":
+        import perfection1 as module
+        prepare_module(module, site_url, workdir, years)
+        module.run_yearly_automated_scrape(mode="download")
+    elif name == "perfection2":
+        import perfection2 as module
+        prepare_module(module, site_url, workdir, years)
+        module.run_yearly_automated_scrape(mode="prod")
+    elif name == "multi_year":
+        import multi_year as module
+        prepare_module(module, site_url, workdir, years)
+        module.run_multithreaded_years(mode="prod")
+    elif name == "async_engine":
+        import async_engine as module
+        prepare_module(module, site_url, workdir, years)
+        asyncio.run(module.run_async_sweep(mode="prod", years=years))
+    else:
+        raise SystemExit(f"unknown scenario {name}")
+
+def child_main(args):
+    import resource
+    years = [str(FIRST_YEAR + i) for i in range(args.years)]
+    # The scrapers are chatty; keep their output out of the benchmark table
+    with open(os.path.join(args.workdir, "scenario.log"), "w") as log:
+        stdout = sys.stdout
+        sys.stdout = log
+        try:
+            run_scenario(args.scenario, args.site, args.workdir, years)
+        finally:
+            sys.stdout = stdout
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    files = sum(1 for root, _, names in os.walk(args.workdir) for n in names if n.endswith("_320kbps.zip"))
+    print(json.dumps({"peak_rss_mb": peak_kb / 1024, "files": files}))
+
+# --- HARNESS ---
+
+def run_benchmark(options, scenarios):
+    site = MockSite(options)
+    server = QuietServer(("127.0.0.1", 0), make_handler(site))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site_url = f"http://127.0.0.1:{server.server_port}"
+    expected = options["years"] * options["pages"] * options["movies"]
+
+    print(f"Mock site: {site_url} | {options['years']} years x {options['pages']} pages x "
+          f"{options['movies']} movies = {expected} albums of {options['payload_kb']} KB")
+    print(f"{'scenario':<14}{'wall s':>9}{'pages/s':>10}{'movies/s':>10}{'MB/s':>9}{'peak RSS MB':>13}{'files':>8}")
+
+    results = []
+    for name in scenarios:
+        site.reset()
+        workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--site", site_url,
+               "--workdir", workdir, "--years", str(options["years"])]
+        started = time.perf_counter()
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        wall = time.perf_counter() - started
+        if proc.returncode != 0:
+            print(f"{name:<14} FAILED\n{proc.stderr[-2000:]}")
+            shutil.rmtree(workdir, ignore_errors=True)
+            continue
+        child = json.loads(proc.stdout.strip().splitlines()[-1])
+        pages = site.counts["listing"] + site.counts["movie"]
+        row = {
+            "scenario": name,
+            "wall_s": wall,
+            "pages_per_s": pages / wall,
+            "movies_per_s": child["files"] / wall,
+            "mb_per_s": site.bytes_sent / wall / (1024 * 1024),
+            "peak_rss_mb": child["peak_rss_mb"],
+            "files": child["files"],
+        }
+        results.append(row)
+        print(f"{name:<14}{wall:>9.2f}{row['pages_per_s']:>10.1f}{row['movies_per_s']:>10.2f}"
+              f"{row['mb_per_s']:>9.1f}{row['peak_rss_mb']:>13.1f}{child['files']:>8}")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    server.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark against a mock masstamilan site")
+    parser.add_argument("scenarios", nargs="*", default=SCENARIOS, help=f"any of {', '.join(SCENARIOS)}")
+    for key, value in DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=value)
+    parser.add_argument("--json", action="store_true", help="print results as JSON as well")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--site", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.scenario = args.child
+        return child_main(args)
+
+    options = {key: getattr(args, key) for key in DEFAULTS}
+    results = run_benchmark(options, args.scenarios)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import threading
+from contextlib import contextmanager
+
+_scope = threading.local()
+
+class Cancelled(Exception):
+    """The work was called off from outside, e.g. its lease went to another
+    worker. Not a failure of the work itself, so it must not be recorded as one."""
+
+# --- SCOPES ---
+
+@contextmanager
+def scope(event):
+    """Runs the block with event as the calling thread's cancel signal: once it is
+    set, check() raises Cancelled. event may be None (nothing to cancel). Threads
+    started inside don't inherit it; pass current() on and enter a scope there."""
+    previous = current()
+    _scope.event = event
+    try:
+        yield event
+    finally:
+        _scope.event = previous
+
+def current():
+    """The calling thread's cancel event, or None outside any scope."""
+    return getattr(_scope, "event", None)
+
+def cancelled():
+    event = current()
+    return event is not None and event.is_set()
+
+def check():
+    """Raises Cancelled if the calling thread's work has been called off."""
+    if cancelled():
+        raise Cancelled("work was called off (lease lost)")
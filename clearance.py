@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- CONFIGURATION ---
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "tamil-music-scraper", "clearance.json")
+DEFAULT_TTL = 30 * 60      # When none of the cookies carry an expiry
+EXPIRY_MARGIN = 120        # Refresh this long before the cookies actually run out
+FAILURE_BACKOFF = 60       # After a failed warm-up, sessions start without cookies for this long
+
+_lock = threading.Lock()
+_last_failure = {}
+
+# --- HELPER FUNCTIONS ---
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock shared with other processes (and hosts, on a share that supports it)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting for the holder
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_cache(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def site_cookies(session, host):
+    """Cookies the session holds for host, as plain dicts."""
+    cookies = []
+    for cookie in session.cookies:
+        domain = cookie.domain.lstrip(".")
+        if not domain or host == domain or host.endswith("." + domain):
+            cookies.append({"name": cookie.name, "value": cookie.value, "domain": cookie.domain,
+                            "path": cookie.path, "expires": cookie.expires})
+    return cookies
+
+def valid_entry(entry, user_agent):
+    # Clearance is tied to the user agent it was solved with
+    return bool(entry) and entry.get("user_agent") == user_agent and \
+        entry.get("expires", 0) - EXPIRY_MARGIN > time.time()
+
+def apply(session, entry):
+    session.headers["User-Agent"] = entry["user_agent"]
+    for cookie in entry["cookies"]:
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"],
+                            expires=cookie["expires"])
+
+# --- CLEARANCE ---
+
+def prepare(session, site_url, headers, timeout=15):
+    """Gives a new session the anti-bot clearance for site_url.
+
+    The cookies and the user agent they were solved with live in CACHE_PATH, so
+    they are shared by every worker and reused by later runs until they expire.
+    When they need refreshing, one worker (across processes too) solves the
+    challenge with this session while the others wait and then reuse its result."""
+    host = urlsplit(site_url).netloc
+    user_agent = headers.get("User-Agent") or session.headers.get("User-Agent")
+    entry = read_cache(CACHE_PATH).get(host)
+    if valid_entry(entry, user_agent):
+        apply(session, entry)
+        return True
+    if time.time() - _last_failure.get(host, 0) < FAILURE_BACKOFF:
+        return False
+
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    with _lock, file_lock(CACHE_PATH + ".lock"):
+        # Someone else may have refreshed it while we waited for the lock
+        data = read_cache(CACHE_PATH)
+        entry = data.get(host)
+        if valid_entry(entry, user_agent):
+            apply(session, entry)
+            return True
+        try:
+            session.get(site_url, headers={**headers, "User-Agent": user_agent}, timeout=timeout)
+        except Exception as e:
+            _last_failure[host] = time.time()
+            print(f"      [!] Clearance warm-up failed, continuing without cookies: {e}")
+            return False
+        cookies = site_cookies(session, host)
+        expiries = [c["expires"] for c in cookies if c["expires"]]
+        data[host] = {
+            "user_agent": user_agent,
+            "cookies": cookies,
+            "expires": min(expiries) if expiries else time.time() + DEFAULT_TTL,
+            "stored_at": time.time(),
+        }
+        write_cache(CACHE_PATH, data)
+        session.headers["User-Agent"] = user_agent
+        print(f"[*] Cleared {host}, {len(cookies)} cookies cached until "
+              f"{time.strftime('%H:%M', time.localtime(data[host]['expires']))}")
+        return True
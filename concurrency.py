@@ -0,0 +1,178 @@
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import retry
+
+# --- CONFIGURATION ---
+DECREASE_FACTOR = 0.5      # Multiplicative cut on a congestion signal
+LATENCY_FACTOR = 3.0       # Page latency this many times the best seen counts as congestion
+LATENCY_ALPHA = 0.2        # Weight of the newest sample in the latency average
+THROUGHPUT_TOLERANCE = 0.95  # A step up that doesn't keep at least this much of the old throughput is undone
+
+_limits = []
+_limits_lock = threading.Lock()
+
+# --- CONTROLLER ---
+
+class AdaptiveLimit:
+    """AIMD concurrency limit, used in place of a fixed worker count.
+
+    Work runs inside slot(url); at most `limit` slots are open at once. Each
+    round (as many completed slots as the limit) without trouble raises the limit
+    by one. A 429/5xx/timeout on a host the limit has been used for, or page
+    latency drifting far above the best seen, halves it (once per round, so one
+    burst of errors counts once). When a step up made overall throughput worse,
+    the step is undone instead. The current state is in snapshot()."""
+
+    def __init__(self, name, initial, minimum=1, maximum=16):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.active = 0
+        self.hosts = set()
+        self.condition = threading.Condition()
+        self.round_started = time.monotonic()
+        self.round_done = 0
+        self.round_bytes = 0
+        self.last_throughput = None
+        self.last_measure = None
+        self.last_step = 0
+        self.cut_this_round = False
+        self.best_latency = None
+        self.avg_latency = None
+        self.congestion_events = 0
+        self.held = threading.local()
+        with _limits_lock:
+            _limits.append(self)
+
+    def watch(self, url):
+        """Lets congestion on url's host count against this limit."""
+        host = urlsplit(url).hostname
+        with self.condition:
+            self.hosts.add(host)
+
+    @contextmanager
+    def slot(self, url=None):
+        """Holds one of the limit's slots for the block. Reentrant per thread: a
+        slot taken inside another of the same limit (a page fetched for a movie
+        that already holds one) doesn't wait for, or count as, a second slot."""
+        if url: self.watch(url)
+        depth = getattr(self.held, "depth", 0)
+        if depth:
+            self.held.depth = depth + 1
+            try:
+                yield self
+            finally:
+                self.held.depth = depth
+            return
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        self.held.depth = 1
+        try:
+            yield self
+        finally:
+            self.held.depth = 0
+            with self.condition:
+                self.active -= 1
+                self.round_done += 1
+                if self.round_done >= self.limit:
+                    self._end_round()
+                self.condition.notify_all()
+
+    def add_bytes(self, num_bytes):
+        with self.condition:
+            self.round_bytes += num_bytes
+
+    def record_latency(self, seconds):
+        """Time a page request took; only meaningful for requests of similar size."""
+        with self.condition:
+            self.best_latency = seconds if self.best_latency is None else min(self.best_latency, seconds)
+            self.avg_latency = seconds if self.avg_latency is None else \
+                LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.avg_latency
+            slow = self.avg_latency > LATENCY_FACTOR * max(self.best_latency, 0.05)
+        if slow:
+            self.congested("latency")
+
+    def congested(self, reason):
+        with self.condition:
+            # One cut per round: the rest of a burst was already in flight at the old limit
+            if self.cut_this_round:
+                return
+            old = self.limit
+            self.limit = max(self.minimum, int(self.limit * DECREASE_FACTOR))
+            self.cut_this_round = True
+            self.congestion_events += 1
+            self.last_step = 0
+            self._reset_round(time.monotonic())
+            if reason == "latency" and self.avg_latency is not None:
+                # Start measuring afresh at the new level
+                self.avg_latency = self.best_latency
+        if self.limit != old:
+            print(f"    [*] {self.name}: {reason}, concurrency {old} -> {self.limit}")
+
+    def _end_round(self):
+        now = time.monotonic()
+        elapsed = max(now - self.round_started, 1e-6)
+        # Bytes/s when the round moved any; a round of only page fetches counts completions/s instead
+        measure = "bytes" if self.round_bytes else "done"
+        throughput = self.round_bytes / elapsed if self.round_bytes else self.round_done / elapsed
+        comparable = measure == self.last_measure
+        if self.cut_this_round:
+            # First round at the reduced limit: only take its measurements
+            self.cut_this_round = False
+            self.last_step = 0
+        elif self.last_step > 0 and comparable and self.last_throughput \
+                and throughput < self.last_throughput * THROUGHPUT_TOLERANCE:
+            # The extra worker didn't pay for itself
+            self.limit = max(self.minimum, self.limit - 1)
+            self.last_step = -1
+        elif self.limit < self.maximum:
+            self.limit += 1
+            self.last_step = 1
+        else:
+            self.last_step = 0
+        self.last_throughput = throughput
+        self.last_measure = measure
+        self._reset_round(now)
+
+    def _reset_round(self, now):
+        self.round_started = now
+        self.round_done = 0
+        self.round_bytes = 0
+
+    def snapshot(self):
+        with self.condition:
+            return {"name": self.name, "limit": self.limit, "active": self.active,
+                    "hosts": sorted(h for h in self.hosts if h), "throughput": self.last_throughput,
+                    "avg_latency": self.avg_latency, "congestion_events": self.congestion_events}
+
+    def report(self):
+        state = self.snapshot()
+        print(f"[*] {self.name}: concurrency limit {state['limit']} "
+              f"after {state['congestion_events']} congestion signals")
+
+# --- SIGNALS ---
+
+def limits():
+    with _limits_lock:
+        return list(_limits)
+
+def on_attempt(url, outcome, elapsed):
+    """retry listener: congestion on a host is reported to every limit used for it."""
+    if isinstance(outcome, int):
+        congested = outcome in retry.RETRYABLE_STATUSES
+    else:
+        congested = retry.is_retryable_error(outcome)
+    if not congested:
+        return
+    host = urlsplit(url).hostname
+    reason = f"HTTP {outcome}" if isinstance(outcome, int) else type(outcome).__name__
+    for limit in limits():
+        if host in limit.hosts:
+            limit.congested(reason)
+
+retry.add_listener(on_attempt)
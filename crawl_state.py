@@ -0,0 +1,170 @@
+import time
+import sqlite3
+import threading
+
+# --- SCHEMA ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    url           TEXT PRIMARY KEY,
+    year          TEXT,
+    title         TEXT,
+    status        TEXT NOT NULL DEFAULT 'DISCOVERED',
+    link          TEXT,
+    file_type     TEXT,
+    save_path     TEXT,
+    bytes         INTEGER,
+    error         TEXT,
+    discovered_at REAL,
+    updated_at    REAL
+);
+CREATE INDEX IF NOT EXISTS movies_year_status ON movies (year, status);
+CREATE TABLE IF NOT EXISTS years (
+    year         TEXT,
+    mode         TEXT,
+    completed_at REAL,
+    PRIMARY KEY (year, mode)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path      TEXT PRIMARY KEY,
+    digest    TEXT NOT NULL,
+    size      INTEGER,
+    etag      TEXT,
+    stored_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_digest ON files (digest);
+CREATE INDEX IF NOT EXISTS files_etag ON files (etag, size);
+CREATE TABLE IF NOT EXISTS validators (
+    path          TEXT PRIMARY KEY,
+    size          INTEGER,
+    etag          TEXT,
+    last_modified TEXT,
+    checked_at    REAL
+);
+"""
+
+DONE_STATUSES = ("SUCCESS",)
+# The state DB lives next to the downloads, usually on a NAS share. WAL needs shared
+# memory between processes that SMB/NFS can't give; the rollback journal only needs
+# file locks. "WAL" is faster for a state DB on local disk.
+JOURNAL_MODE = "DELETE"
+
+# --- STORE ---
+
+class CrawlState:
+    """SQLite record of what has been discovered, resolved and downloaded.
+    Updated as each movie is processed so a crash loses at most one movie."""
+
+    def __init__(self, path, journal_mode=JOURNAL_MODE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        if journal_mode.upper() == "WAL":
+            # Only safe to relax with WAL; a rollback journal needs FULL to survive a power cut
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def _write(self, sql, params=()):
+        with self.lock:
+            self.conn.execute(sql, params)
+            self.conn.commit()
+
+    def _read(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # --- Movies ---
+
+    def record_discovered(self, url, year, title):
+        now = time.time()
+        self._write(
+            "INSERT INTO movies (url, year, title, discovered_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET title = excluded.title, updated_at = excluded.updated_at",
+            (url, year, title, now, now))
+
+    def record_resolved(self, url, link, file_type, save_path):
+        self._write(
+            "UPDATE movies SET link = ?, file_type = ?, save_path = ?, updated_at = ? WHERE url = ?",
+            (link, file_type, save_path, time.time(), url))
+
+    def record_result(self, url, status, num_bytes=None, error=None):
+        self._write(
+            "UPDATE movies SET status = ?, bytes = COALESCE(?, bytes), error = ?, updated_at = ? WHERE url = ?",
+            (status, num_bytes, error, time.time(), url))
+
+    def is_completed(self, url):
+        rows = self._read("SELECT status FROM movies WHERE url = ?", (url,))
+        return bool(rows) and rows[0][0] in DONE_STATUSES
+
+    def completed_files(self, year):
+        """(url, link, save_path) of a year's completed movies."""
+        marks = ",".join("?" * len(DONE_STATUSES))
+        return self._read(
+            f"SELECT url, link, save_path FROM movies WHERE year = ? AND status IN ({marks}) "
+            f"AND link IS NOT NULL AND save_path IS NOT NULL ORDER BY discovered_at", (year, *DONE_STATUSES))
+
+    def known_urls(self, year):
+        """Every movie URL already recorded for a year, whatever its status."""
+        return {row[0] for row in self._read("SELECT url FROM movies WHERE year = ?", (year,))}
+
+    def pending_movies(self, year):
+        """(url, title) of movies in a year that still need work."""
+        marks = ",".join("?" * len(DONE_STATUSES))
+        return self._read(
+            f"SELECT url, title FROM movies WHERE year = ? AND status NOT IN ({marks}) ORDER BY discovered_at",
+            (year, *DONE_STATUSES))
+
+    def year_entries(self, year):
+        """(status, title, url) for every movie seen in a year, in discovery order."""
+        return self._read(
+            "SELECT status, title, url FROM movies WHERE year = ? ORDER BY discovered_at", (year,))
+
+    # --- Years ---
+
+    def mark_year_complete(self, year, mode):
+        self._write("INSERT OR REPLACE INTO years (year, mode, completed_at) VALUES (?, ?, ?)",
+                    (year, mode, time.time()))
+
+    def is_year_complete(self, year, mode):
+        """Whether the year's listing was walked to its end. The current year keeps
+        gaining movies, so it never counts as complete and is always walked again."""
+        if year.isdigit() and int(year) >= time.localtime().tm_year:
+            return False
+        return bool(self._read("SELECT 1 FROM years WHERE year = ? AND mode = ?", (year, mode)))
+
+    # --- Files (content index used for dedup) ---
+
+    def record_file(self, path, digest, size, etag=None):
+        self._write("INSERT OR REPLACE INTO files (path, digest, size, etag, stored_at) VALUES (?, ?, ?, ?, ?)",
+                    (path, digest, size, etag, time.time()))
+
+    def forget_file(self, path):
+        self._write("DELETE FROM files WHERE path = ?", (path,))
+
+    def files_with_digest(self, digest, size):
+        return [row[0] for row in self._read(
+            "SELECT path FROM files WHERE digest = ? AND size = ? ORDER BY stored_at", (digest, size))]
+
+    def files_with_etag(self, etag, size):
+        """(path, digest) of stored files that came from an upstream with this ETag and size."""
+        return self._read("SELECT path, digest FROM files WHERE etag = ? AND size = ? ORDER BY stored_at",
+                          (etag, size))
+
+    # --- Validators (upstream size/ETag/Last-Modified of files on disk) ---
+
+    def record_validators(self, path, size, etag=None, last_modified=None):
+        self._write("INSERT OR REPLACE INTO validators (path, size, etag, last_modified, checked_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (path, size, etag, last_modified, time.time()))
+
+    def validators(self, path):
+        """(size, etag, last_modified) the upstream had when path was last checked,
+        else what the dedup index recorded at download time, else None."""
+        rows = self._read("SELECT size, etag, last_modified FROM validators WHERE path = ?", (path,))
+        if not rows:
+            rows = self._read("SELECT size, etag, NULL FROM files WHERE path = ?", (path,))
+        return rows[0] if rows else None
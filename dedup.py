@@ -0,0 +1,103 @@
+import os
+import hashlib
+import segmented
+
+try:
+    import fcntl
+except ImportError:  # Windows: hardlinks only
+    fcntl = None
+
+# --- CONFIGURATION ---
+DEDUP_ENABLED = True
+FICLONE = 0x40049409  # Linux ioctl that shares extents between two files (btrfs, XFS)
+LINK_SUFFIX = ".link"
+
+# --- HELPER FUNCTIONS ---
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+def reflink(source, target):
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+
+def link_file(existing, save_path):
+    """Makes save_path the same file as existing: a hardlink, or a reflink where
+    hardlinks aren't possible. Returns False (and leaves save_path alone) if neither works."""
+    tmp_path = save_path + LINK_SUFFIX
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(existing, tmp_path)
+    except OSError:
+        if not reflink(existing, tmp_path):
+            return False
+    os.replace(tmp_path, save_path)
+    return True
+
+def same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+def live_copy(state, paths, size, exclude):
+    """The first indexed path that is still on disk with the expected size."""
+    for path in paths:
+        if path == exclude: continue
+        try:
+            if os.path.getsize(path) == size:
+                return path
+        except OSError:
+            pass
+        # Deleted or replaced behind our back: drop it from the index
+        state.forget_file(path)
+    return None
+
+def is_strong_etag(etag):
+    return bool(etag) and not etag.startswith("W/")
+
+# --- DOWNLOAD ---
+
+def download(state, session, url, save_path, headers, segments=segmented.SEGMENTS_PER_FILE, probed=None,
+             pool=None):
+    """segmented.download with content-addressed dedup against the crawl state's file index.
+
+    Before downloading, an upstream ETag + Content-Length seen before for a file
+    still on disk means the bytes are already here: save_path is linked to that
+    file and nothing is fetched. Otherwise the file is hashed (BLAKE2b) while it
+    downloads, and if the same content is already stored under another name the
+    new copy is replaced by a link to it. Returns the file size. probed is what
+    segmented.probe() returned to the caller, if it probed already; pool is passed
+    on to segmented.download."""
+    if not DEDUP_ENABLED or state is None:
+        return segmented.download(session, url, save_path, headers, segments, probed=probed, pool=pool)
+
+    filename = os.path.basename(save_path)
+    probed = probed or segmented.probe(session, url, headers)
+    size, etag, _, _ = probed or segmented.UNKNOWN
+    if size and is_strong_etag(etag):
+        known = dict(state.files_with_etag(etag, size))
+        existing = live_copy(state, list(known), size, save_path)
+        if existing and link_file(existing, save_path):
+            print(f"      [-] {filename} is already stored as {os.path.basename(existing)}, linked")
+            state.record_file(save_path, known[existing], size, etag)
+            return size
+
+    hasher = new_hasher()
+    written = segmented.download(session, url, save_path, headers, segments, probed=probed, hasher=hasher,
+                                 pool=pool)
+    digest = hasher.hexdigest()
+    existing = live_copy(state, state.files_with_digest(digest, written), written, save_path)
+    if existing and not same_file(existing, save_path) and link_file(existing, save_path):
+        print(f"      [-] {filename} has the same content as {os.path.basename(existing)}, linked")
+    state.record_file(save_path, digest, written, etag if is_strong_etag(etag) else None)
+    return written
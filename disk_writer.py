@@ -0,0 +1,144 @@
+import os
+import sys
+import ctypes
+import threading
+import bandwidth
+import cancellation
+
+# --- CONFIGURATION ---
+WRITE_SIZE = 8 * 1024 * 1024   # Bytes gathered before each write; large sequential writes suit network mounts
+FSYNC_ON_COMPLETE = False      # Flush finished files to stable storage before they are renamed into place
+FALLOC_FL_KEEP_SIZE = 0x01
+
+_buffers = threading.local()
+_libc = None
+
+# --- HELPER FUNCTIONS ---
+
+def write_buffer():
+    """One reusable WRITE_SIZE buffer per thread, so downloads don't allocate per chunk."""
+    view = getattr(_buffers, "view", None)
+    if view is None or len(view) != WRITE_SIZE:
+        view = _buffers.view = memoryview(bytearray(WRITE_SIZE))
+    return view
+
+def _fallocate_keep_size(fd, offset, length):
+    """Linux fallocate(FALLOC_FL_KEEP_SIZE): reserves blocks without changing the
+    file size, so size-based resume still sees only the bytes actually written."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    return _libc.fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) == 0
+
+def preallocate(f, offset, length, keep_size=False):
+    """Reserves disk space for length bytes at offset so concurrent downloads on the
+    same volume don't interleave their blocks. Best effort: filesystems (and SMB/NFS
+    mounts) that can't do it are simply skipped. With keep_size the file's visible
+    size is left alone; otherwise it is extended to offset + length."""
+    if length <= 0:
+        return
+    fd = f.fileno()
+    try:
+        if keep_size:
+            if sys.platform.startswith("linux"):
+                _fallocate_keep_size(fd, offset, length)
+            return
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, offset, length)
+            return
+    except (OSError, AttributeError):
+        pass
+    if not keep_size and os.fstat(fd).st_size < offset + length:
+        f.truncate(offset + length)
+
+def finish(f):
+    """Called once a file is complete, before it gets its final name."""
+    f.flush()
+    if FSYNC_ON_COMPLETE:
+        os.fsync(f.fileno())
+
+def write_all(f, view):
+    """Unbuffered writes may be partial (notably on network mounts); loop until done."""
+    while view:
+        count = f.write(view)
+        view = view[count:]
+
+def replay(path, tap, limit=None):
+    """Reads the first limit bytes of path (all of it by default) through tap(view),
+    for checks that have to catch up on bytes an earlier attempt already wrote."""
+    view = write_buffer()
+    remaining = limit
+    with open(path, "rb", buffering=0) as f:
+        while remaining is None or remaining > 0:
+            count = f.readinto(view if remaining is None else view[:min(len(view), remaining)])
+            if not count:
+                break
+            tap(view[:count])
+            if remaining is not None:
+                remaining -= count
+
+def _raw_readable(response):
+    # raw.readinto hands back the bytes as sent, so it is only usable when the body isn't compressed
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    return encoding == "identity" and hasattr(getattr(response, "raw", None), "readinto")
+
+# --- WRITER ---
+
+def copy_response(response, f, limit=None, progress=None, chunk_size=1024 * 1024, tap=None):
+    """Copies a streamed requests response into f, returning the bytes written.
+    Reads straight into a reused buffer and writes it in WRITE_SIZE pieces; stops
+    after limit bytes when given. f should be opened unbuffered (buffering=0).
+    progress(written) is called after every write, once the bytes are in the file.
+    Compressed bodies go through iter_content(chunk_size) instead of readinto.
+    tap(view), when given, sees every buffer just before it is written.
+    Reads are paced by the global bandwidth cap, if one is set. Raises
+    cancellation.Cancelled once the calling thread's work is called off."""
+    view = write_buffer()
+    written = filled = 0
+    try:
+        if _raw_readable(response):
+            while limit is None or written + filled < limit:
+                cancellation.check()
+                room = len(view) - filled
+                if limit is not None:
+                    room = min(room, limit - written - filled)
+                count = response.raw.readinto(view[filled:filled + bandwidth.read_size(room)])
+                if not count:
+                    break
+                bandwidth.consume(count)
+                filled += count
+                if filled == len(view):
+                    filled = 0
+                    if tap: tap(view)
+                    write_all(f, view)
+                    written += len(view)
+                    if progress: progress(written)
+        else:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                cancellation.check()
+                if limit is not None:
+                    chunk = chunk[:limit - written - filled]
+                bandwidth.consume(len(chunk))
+                while chunk:
+                    take = min(len(chunk), len(view) - filled)
+                    view[filled:filled + take] = chunk[:take]
+                    filled += take
+                    chunk = chunk[take:]
+                    if filled == len(view):
+                        filled = 0
+                        if tap: tap(view)
+                        write_all(f, view)
+                        written += len(view)
+                        if progress: progress(written)
+                if limit is not None and written + filled >= limit:
+                    break
+    finally:
+        # Keep whatever arrived before a dropped connection, so a resume starts after it.
+        # Not after a cancel: the file may already belong to whoever took the work over
+        if filled and not cancellation.cancelled():
+            if tap: tap(view[:filled])
+            write_all(f, view[:filled])
+            written += filled
+            if progress: progress(written)
+    return written
@@ -0,0 +1,174 @@
+import os
+import disk_writer
+import zip_check
+
+# --- CONFIGURATION ---
+PART_SUFFIX = ".part"
+VALIDATOR_SUFFIX = ".validator"  # Next to a .part: the ETag/Last-Modified its bytes came with
+CHUNK_SIZE = 1024 * 1024
+
+class IncompleteDownload(ConnectionError):
+    """The server closed the stream before Content-Length bytes arrived."""
+
+# --- HELPER FUNCTIONS ---
+
+def part_path_for(save_path):
+    return save_path + PART_SUFFIX
+
+def resume_offset(part_path):
+    """Bytes already on disk from an earlier, interrupted attempt."""
+    try:
+        return os.path.getsize(part_path)
+    except OSError:
+        return 0
+
+def range_headers(headers, offset):
+    if not offset:
+        return dict(headers)
+    merged = dict(headers)
+    merged["Range"] = f"bytes={offset}-"
+    return merged
+
+def total_from_content_range(value):
+    """'bytes 100-199/200' or 'bytes */200' -> 200; None if unknown."""
+    if not value or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+def validator_from(headers):
+    """What If-Range can use to tell this version of a file: a strong ETag, else Last-Modified."""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+def load_validator(part_path):
+    try:
+        with open(part_path + VALIDATOR_SUFFIX, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def save_validator(part_path, validator):
+    validator_path = part_path + VALIDATOR_SUFFIX
+    if validator:
+        with open(validator_path, "w", encoding="utf-8") as f:
+            f.write(validator)
+    elif os.path.exists(validator_path):
+        os.remove(validator_path)
+
+def resume_headers(headers, part_path, offset):
+    """(headers, offset) for continuing a part file. The Range only applies if the
+    file is still the version the part came from (If-Range); a part with no
+    validator on record starts again from zero rather than risk splicing two versions."""
+    validator = load_validator(part_path) if offset else None
+    if not validator:
+        return dict(headers), 0
+    merged = range_headers(headers, offset)
+    merged["If-Range"] = validator
+    return merged, offset
+
+def promote(part_path, save_path):
+    """Atomically gives a finished part file its final name."""
+    os.replace(part_path, save_path)
+    save_validator(part_path, None)
+
+def start_checks(save_path, part_path, offset, hasher=None):
+    """Sets up the checks that run while save_path streams in: a ZipStreamVerifier
+    when it is a zip (returned, else None) and the optional content hasher. Both
+    are caught up on the offset bytes already in the part file; a part that is
+    already corrupt is removed."""
+    verifier = None
+    if zip_check.wants_check(save_path):
+        verifier = zip_check.ZipStreamVerifier(os.path.basename(save_path))
+    tap = tap_for(verifier, hasher)
+    if offset and tap:
+        try:
+            disk_writer.replay(part_path, tap, offset)
+        except zip_check.CorruptZip:
+            os.remove(part_path)
+            raise
+    return verifier
+
+def tap_for(verifier, hasher):
+    """One callable feeding every written buffer to the verifier and the hasher."""
+    taps = [tap for tap in (verifier.feed if verifier else None, hasher.update if hasher else None) if tap]
+    if len(taps) < 2:
+        return taps[0] if taps else None
+    def tap(view):
+        for each in taps:
+            each(view)
+    return tap
+
+def finish_zip_check(verifier, part_path, expected):
+    """Raises if the downloaded archive is incomplete. A stream cut short is kept for
+    resuming; an archive that is broken even though every byte arrived is removed."""
+    if verifier is None:
+        return
+    try:
+        verifier.finish()
+    except zip_check.TruncatedZip as e:
+        if expected is None:
+            # No Content-Length to go by: the connection dropped, resume next time
+            raise IncompleteDownload(str(e)) from None
+        os.remove(part_path)
+        raise
+
+# --- DOWNLOAD ---
+
+def download_file(session, url, save_path, headers, chunk_size=CHUNK_SIZE, hasher=None):
+    """Streams url into save_path via a .part file, resuming with an HTTP Range
+    request when an earlier attempt left one behind (guarded by If-Range with the
+    validator the part was started with). Raises on failure; the part
+    file is kept so the next attempt can pick up where this one stopped, unless
+    it is a zip that failed its integrity check (zip_check.CorruptZip).
+    hasher (a hashlib object) is fed the whole file, resumed prefix included."""
+    part_path = part_path_for(save_path)
+    request_headers, offset = resume_headers(headers, part_path, resume_offset(part_path))
+
+    with session.get(url, headers=request_headers, stream=True) as r:
+        if offset and r.status_code == 416:
+            # Nothing left to fetch if the part already holds the whole file
+            if total_from_content_range(r.headers.get("Content-Range")) == offset:
+                finish_zip_check(start_checks(save_path, part_path, offset, hasher), part_path, offset)
+                promote(part_path, save_path)
+                return offset
+            os.remove(part_path)
+            return download_file(session, url, save_path, headers, chunk_size, hasher)
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            expected = total_from_content_range(r.headers.get("Content-Range"))
+            mode = 'ab'
+        else:
+            # No Range sent, ignored, or the file changed since the part was started (If-Range)
+            offset = 0
+            length = r.headers.get("Content-Length")
+            expected = int(length) if length and length.isdigit() else None
+            mode = 'wb'
+            save_validator(part_path, validator_from(r.headers))
+
+        # Zips are checked as they stream in, so a bad member fails the download right away
+        verifier = start_checks(save_path, part_path, offset, hasher)
+        written = offset
+        try:
+            with open(part_path, mode, buffering=0) as f:
+                if expected is not None:
+                    # Reserve the rest of the file up front; the visible size still tracks
+                    # what was written, which is what resume_offset relies on
+                    disk_writer.preallocate(f, offset, expected - offset, keep_size=True)
+                try:
+                    written += disk_writer.copy_response(r, f, chunk_size=chunk_size,
+                                                         tap=tap_for(verifier, hasher))
+                finally:
+                    disk_writer.finish(f)
+        except zip_check.CorruptZip:
+            os.remove(part_path)
+            raise
+
+    if expected is not None and written != expected:
+        raise IncompleteDownload(f"incomplete download: {written} of {expected} bytes")
+    finish_zip_check(verifier, part_path, expected)
+    promote(part_path, save_path)
+    return written
@@ -0,0 +1,51 @@
+import os
+
+# --- INDEX ---
+
+class Library:
+    """Which files are in the download folders, for skip decisions.
+
+    Each folder is listed once, with a single os.scandir, the first time a path
+    in it is asked about; after that lookups are set membership tests in memory
+    instead of a stat on the share per movie. Downloads that finish are add()ed
+    and files removed for a re-fetch are discard()ed, so the index stays current
+    for the rest of the run. Changes made behind its back by other processes are
+    only seen by the next run."""
+
+    def __init__(self):
+        self.folders = {}
+
+    def reset(self):
+        """Forgets every listing, e.g. at the start of a run."""
+        self.folders = {}
+
+    @staticmethod
+    def _split(path):
+        folder, name = os.path.split(os.path.abspath(path))
+        return os.path.normcase(folder), os.path.normcase(name)
+
+    def _names(self, folder):
+        names = self.folders.get(folder)
+        if names is None:
+            listed = set()
+            try:
+                with os.scandir(folder) as entries:
+                    # is_file() comes from the directory listing itself, no stat per entry
+                    listed.update(os.path.normcase(e.name) for e in entries if e.is_file())
+            except FileNotFoundError:
+                pass
+            # Two threads may list the same folder at once; the first result is kept
+            names = self.folders.setdefault(folder, listed)
+        return names
+
+    def has(self, path):
+        folder, name = self._split(path)
+        return name in self._names(folder)
+
+    def add(self, path):
+        folder, name = self._split(path)
+        self._names(folder).add(name)
+
+    def discard(self, path):
+        folder, name = self._split(path)
+        self._names(folder).discard(name)
@@ -0,0 +1,294 @@
+import re
+import codecs
+import threading
+import multiprocessing
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.compat import chardet
+
+try:
+    import lxml.html
+    import lxml.etree
+except ImportError:  # lxml is optional, the bs4 backends cover it
+    lxml = None
+
+# --- CONFIGURATION ---
+# "lxml"        lxml.html tree, fastest (needs the lxml package)
+# "strainer"    BeautifulSoup that only builds the grid containers / <a> tags
+# "html.parser" full BeautifulSoup tree, the original behaviour
+PARSER_BACKEND = "lxml" if lxml is not None else "strainer"
+SOUP_PARSER = "lxml" if lxml is not None else "html.parser"
+# >0 parses whole pages in this many worker processes, so threaded crawls aren't held
+# up on the GIL while they parse; 0 parses in the calling thread
+PARSE_PROCESSES = 0
+
+PAGE_LINK = re.compile(r"""href=["'][^"']*[?&](?:amp;)?page=(\d+)""")
+GRID_XPATH = ("//div[contains(concat(' ', normalize-space(@class), ' '), ' gw ')]"
+              " | //section[contains(concat(' ', normalize-space(@class), ' '), ' bots ')]")
+# Matched against the raw class attribute while parsing, so "row gw" must match too
+GRID_STRAINER = SoupStrainer(["div", "section"], class_=re.compile(r"(^|\s)(gw|bots)(\s|$)"))
+LINK_STRAINER = SoupStrainer("a", href=True)
+XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+# --- HELPER FUNCTIONS ---
+
+def is_movie_link(href, text):
+    return "-songs" in href and text and "browse-by-year" not in href
+
+def last_page_number(html):
+    """Highest ?page=N linked anywhere on the page, or None if there is no pagination."""
+    last_page = max((int(n) for n in PAGE_LINK.findall(html)), default=0)
+    return last_page if last_page > 1 else None
+
+def _soup_grid(html, backend):
+    if backend == "strainer":
+        soup = BeautifulSoup(html, SOUP_PARSER, parse_only=GRID_STRAINER)
+    else:
+        soup = BeautifulSoup(html, 'html.parser')
+    return soup.find('div', class_='gw') or soup.find('section', class_='bots')
+
+def _lxml_root(html):
+    """lxml tree of a page, or None when there is nothing to parse. lxml refuses
+    an empty or whitespace-only body (ParserError) and a str that still carries
+    its <?xml encoding=...?> declaration (ValueError); the declaration is dropped,
+    the text is already decoded."""
+    try:
+        return lxml.html.fromstring(html)
+    except lxml.etree.ParserError:
+        return None
+    except ValueError:
+        try:
+            return lxml.html.fromstring(XML_DECLARATION.sub("", html, count=1))
+        except (lxml.etree.ParserError, ValueError):
+            return None
+
+# --- EXTRACTION ---
+
+def _listing_grid(html, backend):
+    """The page's movie grid (an lxml element for "lxml", a bs4 Tag otherwise), or None."""
+    if backend == "lxml":
+        root = _lxml_root(html)
+        if root is None: return None
+        grids = root.xpath(GRID_XPATH)
+        # Same precedence as the soup backends: a div.gw beats a section.bots
+        grids.sort(key=lambda el: el.tag != "div")
+        return grids[0] if grids else None
+    return _soup_grid(html, backend)
+
+def extract_listing(html, page_url, backend=None):
+    """Parses a browse-by-year page into ([(full_url, title), ...], last_page).
+    links is None when the page has no movie grid at all."""
+    backend = backend or PARSER_BACKEND
+    last_page = last_page_number(html)
+    grid = _listing_grid(html, backend)
+    if grid is None: return None, last_page
+
+    if backend == "lxml":
+        anchors = ((a.get("href"), a.text_content().strip()) for a in grid.iter("a") if a.get("href"))
+    else:
+        anchors = ((a['href'], a.text.strip()) for a in grid.find_all('a', href=True))
+
+    links = [(urljoin(page_url, href), text) for href, text in anchors if is_movie_link(href, text)]
+    return links, last_page
+
+def extract_listing_entries(html, page_url, backend=None):
+    """Like extract_listing, but reads each movie's card: ([(full_url, title,
+    details), ...], last_page), where details are the lines under the title in
+    the card's link (starring, director, ...). A card is a div.a-i and only its
+    first link counts; a grid without cards falls back to every link in it.
+    entries is None when the page has no movie grid at all."""
+    backend = backend or PARSER_BACKEND
+    last_page = last_page_number(html)
+    grid = _listing_grid(html, backend)
+    if grid is None: return None, last_page
+
+    if backend == "lxml":
+        blocks = grid.xpath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' a-i ')]")
+        if blocks:
+            anchors = [next(iter(block.xpath(".//a[@href]")), None) for block in blocks]
+        else:
+            anchors = grid.xpath(".//a[@href]")
+        anchors = ((a.get("href"), "\n".join(a.itertext())) for a in anchors if a is not None)
+    else:
+        blocks = grid.find_all('div', class_='a-i')
+        if blocks:
+            anchors = [block.find('a', href=True) for block in blocks]
+        else:
+            anchors = grid.find_all('a', href=True)
+        anchors = ((a['href'], a.get_text(separator="\n")) for a in anchors if a is not None)
+
+    entries = []
+    for href, text in anchors:
+        lines = [line.strip() for line in text.split("\n") if line.strip()]
+        if is_movie_link(href, lines):
+            entries.append((urljoin(page_url, href), lines[0], lines[1:]))
+    return entries, last_page
+
+def find_download_link(html, movie_url, backend=None):
+    """Single pass over a movie page's anchors. Returns (link, "zip"|"mp3") preferring
+    the album zip320 over the first d320 song, or (None, "")."""
+    backend = backend or PARSER_BACKEND
+    if backend == "lxml":
+        root = _lxml_root(html)
+        if root is None: return None, ""
+        hrefs = (a.get("href") for a in root.iter("a"))
+    else:
+        strainer = LINK_STRAINER if backend == "strainer" else None
+        parser = SOUP_PARSER if backend == "strainer" else 'html.parser'
+        hrefs = (a.get('href') for a in BeautifulSoup(html, parser, parse_only=strainer).find_all('a', href=True))
+
+    fallback = None
+    for href in hrefs:
+        if not href: continue
+        if "zip320" in href:
+            return urljoin(movie_url, href), "zip"
+        if fallback is None and "d320" in href:
+            fallback = href
+    if fallback is not None:
+        return urljoin(movie_url, fallback), "mp3"
+    return None, ""
+
+# --- PARSER PROCESSES ---
+
+_parser_pool = None
+_parser_pool_lock = threading.Lock()
+
+def set_parse_processes(count):
+    """Changes PARSE_PROCESSES; the pool is started on first use."""
+    global PARSE_PROCESSES, _parser_pool
+    with _parser_pool_lock:
+        PARSE_PROCESSES = count
+        if _parser_pool is not None:
+            _parser_pool.shutdown(wait=False)
+            _parser_pool = None
+
+def parser_pool():
+    global _parser_pool
+    if PARSE_PROCESSES <= 0:
+        return None
+    with _parser_pool_lock:
+        if _parser_pool is None:
+            # Forking a process that already runs threads can copy a lock some other
+            # thread held mid-update; spawned workers start from a clean interpreter
+            _parser_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES,
+                                               mp_context=multiprocessing.get_context("spawn"))
+        return _parser_pool
+
+def _parse(function, html, url):
+    pool = parser_pool()
+    if pool is None:
+        return function(html, url)
+    # Only the page text goes over and only the link tuples come back
+    return pool.submit(function, html, url, PARSER_BACKEND).result()
+
+def parse_listing(html, page_url):
+    """extract_listing, in the parser processes when PARSE_PROCESSES is set."""
+    return _parse(extract_listing, html, page_url)
+
+def parse_download_link(html, movie_url):
+    """find_download_link, in the parser processes when PARSE_PROCESSES is set."""
+    return _parse(find_download_link, html, movie_url)
+
+def parses_in_processes():
+    """True when whole pages should be handed to the parser processes rather
+    than streamed through the scanner on the calling thread."""
+    return PARSE_PROCESSES > 0
+
+# --- STREAMING ---
+
+def declared_encoding(content_type):
+    """charset parameter of a Content-Type header, or None. Unlike requests'
+    r.encoding this doesn't make up ISO-8859-1 for a text/html without one."""
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return _known_codec(value.strip().strip("\"'"))
+    return None
+
+def decode_page(body, content_type):
+    """Text of a whole page body, by its declared charset or else sniffed."""
+    encoding = declared_encoding(content_type) or sniff_encoding(body[:16 * 1024])
+    return body.decode(encoding, errors="replace")
+
+def _known_codec(name):
+    try:
+        return codecs.lookup(name).name if name else None
+    except LookupError:
+        return None
+
+def sniff_encoding(head):
+    """Encoding of a page whose headers don't name one, from its first bytes: a
+    <meta charset>, else utf-8 when they decode as such, else chardet's guess."""
+    match = META_CHARSET.search(head)
+    encoding = _known_codec(match.group(1).decode("ascii")) if match else None
+    if encoding:
+        return encoding
+    try:
+        # Incremental, so a multi-byte character cut off at the end of the chunk is fine
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    return _known_codec(chardet.detect(head).get("encoding")) or "utf-8"
+
+class _DownloadLinkScanner(HTMLParser):
+    """Incremental anchor scan that remembers the first d320 and stops caring
+    about the rest of the page as soon as a zip320 shows up."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.zip_href = None
+        self.mp3_href = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" or self.zip_href: return
+        href = dict(attrs).get("href")
+        if not href: return
+        if "zip320" in href:
+            self.zip_href = href
+        elif self.mp3_href is None and "d320" in href:
+            self.mp3_href = href
+
+class DownloadLinkStream:
+    """Push-style wrapper for callers that receive chunks themselves (asyncio).
+    feed() returns True once the zip320 anchor has been seen. encoding is the one
+    the response headers declare, if any; otherwise it is sniffed from the first chunk."""
+
+    def __init__(self, movie_url, encoding=None):
+        self.movie_url = movie_url
+        self.encoding = encoding
+        self.decoder = None
+        self.scanner = _DownloadLinkScanner()
+
+    def feed(self, chunk):
+        if self.decoder is None:
+            self.encoding = self.encoding or sniff_encoding(chunk)
+            self.decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        self.scanner.feed(self.decoder.decode(chunk))
+        return self.scanner.zip_href is not None
+
+    def result(self):
+        """(link, "zip"|"mp3") or (None, ""); call once the stream stops."""
+        if not self.scanner.zip_href:
+            if self.decoder is not None:
+                self.scanner.feed(self.decoder.decode(b"", final=True))
+            self.scanner.close()
+        if self.scanner.zip_href:
+            return urljoin(self.movie_url, self.scanner.zip_href), "zip"
+        if self.scanner.mp3_href:
+            return urljoin(self.movie_url, self.scanner.mp3_href), "mp3"
+        return None, ""
+
+def scan_download_link(chunks, movie_url, encoding=None):
+    """Same result as find_download_link, but fed from an iterator of raw byte
+    chunks. Stops pulling chunks the moment the zip320 anchor is parsed, so the
+    caller can close the response without reading the rest of the page; the
+    d320 fallback is only used if the page ends without a zip."""
+    stream = DownloadLinkStream(movie_url, encoding)
+    for chunk in chunks:
+        if stream.feed(chunk):
+            break
+    return stream.result()
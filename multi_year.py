@@ -1,89 +1,139 @@
 import os
-import time
-import cloudscraper
+import session_pool
+import site_client
 import re
-from bs4 import BeautifulSoup
-import requests
+import rate_limiter
+import retry
+import dedup
+import page_cache
+import year_scanner
+import crawl_state
+import cancellation
+import work_queue
+import concurrency
+import bandwidth
+import upstream_check
+import library
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- CONFIGURATION ---
 START_YEAR = 2001
 END_YEAR = 2004
+SITE_URL = "https://www.masstamilan.dev"
 ROOT_DOWNLOAD_FOLDER = r"Z:\music" # change
-MAX_YEARS_AT_ONCE = 1  # How many years to download simultaneously
+MAX_YEARS_AT_ONCE = 8  # Years in flight; how many page fetches and movies run at once is adapted by MOVIE_LIMIT
+INITIAL_MOVIES = 1  # Simultaneous movies to start from
+LISTING_WORKERS = 4  # Listing pages fetched at once within a year
+STATE_DB_PATH = os.path.join(ROOT_DOWNLOAD_FOLDER, "crawl_state.sqlite3")
+WORK_QUEUE_PATH = os.path.join(ROOT_DOWNLOAD_FOLDER, "work_queue.sqlite3")  # Shared by every sharded worker
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Referer": "https://www.google.com/",
 }
 
+PAGE_REQUESTS_PER_SEC = 2.0  # Shared by every worker, per host
+PAGE_BURST = 4
+DOWNLOADS_PER_SEC = 0.5
+DOWNLOAD_BURST = 2
+PROBES_PER_SEC = 2.0  # HEADs of download links for sizes and audits, paced apart from pages and downloads
+PROBE_BURST = 4
+SEGMENTS_PER_FILE = 4  # Parallel byte ranges per large file
+MAX_SEGMENT_CONNECTIONS = 16  # Segment connections across all downloads
+PARSE_PROCESSES = 0  # >0 parses pages in worker processes instead of the I/O threads
+MAX_DOWNLOAD_BYTES_PER_SEC = 0  # Cap on all downloads together, shared fairly between years; 0 = no cap
+BANDWIDTH_SCHEDULE = []  # (start_hour, end_hour, bytes_per_sec) overrides, e.g. [(9, 18, 4 * 1024 * 1024)] in office hours
+YEAR_WEIGHTS = {}  # Share of the cap per year relative to the others (default 1), e.g. {"2024": 2}
+VERIFY_EXISTING = False  # Audit files on disk against a HEAD of their link (size, ETag/Last-Modified) instead of trusting the name
+
 YEARS_TO_DOWNLOAD = [str(y) for y in range(START_YEAR, END_YEAR + 1)]
-scraper = cloudscraper.create_scraper()
+PAGE_CACHE = page_cache.PageCache()
+# Grows while the site keeps up, halves on 429/503s, timeouts or pages slowing down
+MOVIE_LIMIT = concurrency.AdaptiveLimit("movies", INITIAL_MOVIES, maximum=MAX_YEARS_AT_ONCE)
+SESSIONS = session_pool.SessionPool(lambda: site_client.new_session(SITE_URL, HEADERS))
+LIBRARY = library.Library()
 
 # --- HELPER FUNCTIONS ---
 
-def get_soup(url):
-    try:
-        time.sleep(0.5) 
-        response = scraper.get(url, headers=HEADERS, timeout=15)
-        if response.status_code == 200:
-            return BeautifulSoup(response.text, 'html.parser')
-        return None
-    except Exception:
-        return None
-
-def download_movie_content(movie_url, year_path, year_label):
+def fetch_page(url, extra_headers):
+    # Listing pages of every year in flight share the adaptive limit with the movies,
+    # so MAX_YEARS_AT_ONCE doesn't multiply the requests sent at once
+    return site_client.fetch_page(SESSIONS, url, {**HEADERS, **extra_headers}, MOVIE_LIMIT)
+
+def get_html(url):
+    return site_client.get_html(PAGE_CACHE, fetch_page, url)
+
+def record_result(state, movie_url, status, num_bytes=None, error=None):
+    if state: state.record_result(movie_url, status, num_bytes, error)
+
+def download_movie_content(movie_url, year_path, year_label, state=None):
     """Downloads a single movie album"""
-    soup = get_soup(movie_url)
-    if not soup: return False
+    resolved = site_client.resolve_download_link(SESSIONS, fetch_page, movie_url, HEADERS)
+    if not resolved:
+        record_result(state, movie_url, "FAILED", error="movie page unavailable")
+        return False
 
-    target_link = None
-    file_type = ""
-    
     base_name = movie_url.split('/')[-1].split('?')[0]
     movie_name = re.sub(r'[\\/*?:"<>|]', "", base_name).replace("-", "_")
 
-    all_links = soup.find_all('a', href=True)
-    for a in all_links:
-        if "zip320" in a['href']:
-            target_link = requests.compat.urljoin(movie_url, a['href'])
-            file_type = "zip"
-            break
-            
-    if not target_link:
-        for a in all_links:
-            if "d320" in a['href']:
-                target_link = requests.compat.urljoin(movie_url, a['href'])
-                file_type = "mp3"
-                break
+    # The album zip320 wins over a single d320 song
+    target_link, file_type = resolved
 
     if target_link:
         ext = ".zip" if file_type == "zip" else ".mp3"
         filename = f"{movie_name}_320kbps{ext}"
         save_path = os.path.join(year_path, filename)
-        
-        if os.path.exists(save_path):
-            print(f"[{year_label}] Skipping: {filename}")
-            return True
 
         try:
+            if state: state.record_resolved(movie_url, target_link, file_type, save_path)
+            # A wrong-sized or changed file is resumed or fetched again below
+            if LIBRARY.has(save_path) and (not VERIFY_EXISTING or
+                    site_client.verify_existing(SESSIONS, LIBRARY, state, target_link, save_path, HEADERS)):
+                print(f"[{year_label}] Skipping: {filename}")
+                record_result(state, movie_url, "SUCCESS")
+                return True
+
             print(f"[{year_label}] Downloading {filename}...")
-            with scraper.get(target_link, headers=HEADERS, stream=True) as r:
-                r.raise_for_status()
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        if chunk: f.write(chunk)
+            def attempt():
+                rate_limiter.acquire(target_link, "download")
+                # Paced by the year's share of the bandwidth cap
+                with SESSIONS.session() as session, bandwidth.flow(year_label):
+                    # Byte ranges for large files, .part resume, and a hardlink when the content is already stored
+                    return dedup.download(state, session, target_link, save_path, HEADERS, SEGMENTS_PER_FILE,
+                                          pool=SESSIONS)
+            MOVIE_LIMIT.watch(target_link)
+            written = retry.call(target_link, attempt)
+            MOVIE_LIMIT.add_bytes(written)
+            LIBRARY.add(save_path)
             print(f"[{year_label}] SUCCESS: {filename}")
+            record_result(state, movie_url, "SUCCESS", written)
             return True
+        except cancellation.Cancelled:
+            # Not a failure: another worker owns the year now and will fetch it
+            raise
         except Exception as e:
             print(f"[{year_label}] FAILED {filename}: {e}")
+            record_result(state, movie_url, "FAILED", error=str(e))
             return False
+    record_result(state, movie_url, "FAILED", error="no zip320/d320 link")
     return False
 
 # --- CORE LOGIC ---
 
-def process_single_year(year, mode):
-    """This function handles one whole year from start to finish"""
-    year_base_url = f"https://www.masstamilan.dev/browse-by-year/{year}"
+def process_movie(movie_url, title, mode, current_save_path, year, state=None):
+    if mode == "test":
+        return f"Movie: {title} | URL: {movie_url}"
+    # Stops a sharded year between movies once its lease has gone to another worker
+    cancellation.check()
+    with MOVIE_LIMIT.slot(SITE_URL):
+        success = download_movie_content(movie_url, current_save_path, year, state)
+    status = "SUCCESS" if success else "FAILED"
+    return f"[{status}] Movie: {title} | URL: {movie_url}"
+
+def process_single_year(year, mode, state=None, incremental=False):
+    """This function handles one whole year from start to finish.
+    With incremental=True the listing is only walked until a page holds
+    nothing but movies already in the crawl state."""
+    year_base_url = f"{SITE_URL}/browse-by-year/{year}"
     
     # Setup paths
     if mode == "test":
@@ -95,42 +145,66 @@ def process_single_year(year, mode):
     
     print(f"\n>>> STARTED PROCESSING YEAR: {year} <<<")
     
-    current_page = 1
     global_seen_urls = set()
     report_data = []
+    incremental = incremental and state is not None
+    known_urls = state.known_urls(year) if incremental else set()
+    caught_up = False
 
-    while True:
-        page_url = f"{year_base_url}?page={current_page}"
-        soup = get_soup(page_url)
-        if not soup: break
+    # Completed movies' files are checked against upstream; mismatches rejoin the unfinished ones
+    if VERIFY_EXISTING and state:
+        upstream_check.audit_year(
+            state, year,
+            lambda link, path: site_client.verify_existing(SESSIONS, LIBRARY, state, link, path, HEADERS),
+            LIBRARY.has)
 
-        main_grid = soup.find('div', class_='gw') or soup.find('section', class_='bots')
-        if not main_grid: break
+    # Year pages were fully walked on an earlier run: retry what is unfinished,
+    # and outside incremental mode don't look at the listing again
+    year_already_scanned = bool(state and state.is_year_complete(year, mode))
+    if year_already_scanned or incremental:
+        pending = state.pending_movies(year)
+        print(f"[{year}] Retrying {len(pending)} unfinished movies from earlier runs")
+        for movie_url, title in pending:
+            report_data.append(process_movie(movie_url, title, mode, current_save_path, year, state))
 
+    # Page 1 gives the page count, the rest of the listing is fetched concurrently
+    listing_workers = 1 if incremental else LISTING_WORKERS
+    year_pages = []
+    if incremental or not year_already_scanned:
+        year_pages = year_scanner.iter_year_pages(year_base_url, get_html, listing_workers)
+
+    for current_page, page_links in year_pages:
         page_movies = []
-        for a in main_grid.find_all('a', href=True):
-            href = a['href']
-            text = a.text.strip()
-            if "-songs" in href and text and "browse-by-year" not in href:
-                full_url = requests.compat.urljoin(page_url, href)
-                if full_url not in global_seen_urls:
-                    page_movies.append((full_url, text))
-                    global_seen_urls.add(full_url)
+        for full_url, text in page_links:
+            if full_url not in global_seen_urls:
+                page_movies.append((full_url, text))
+                global_seen_urls.add(full_url)
 
         if not page_movies: break
 
+        if incremental:
+            # Known movies were handled above; a page of only known ones means we're caught up
+            page_movies = [m for m in page_movies if m[0] not in known_urls]
+            if not page_movies:
+                print(f"[{year}] Page {current_page} has no new movies, stopping sync")
+                caught_up = True
+                break
+
         # Process movies within this year sequentially
         for movie_url, title in page_movies:
-            if mode == "test":
-                report_data.append(f"Movie: {title} | URL: {movie_url}")
-            else:
-                success = download_movie_content(movie_url, current_save_path, year)
-                status = "SUCCESS" if success else "FAILED"
-                report_data.append(f"[{status}] Movie: {title} | URL: {movie_url}")
-        
-        current_page += 1
+            if state:
+                state.record_discovered(movie_url, year, title)
+                # Completed on an earlier run: recorded, but not fetched again
+                if state.is_completed(movie_url): continue
+            report_data.append(process_movie(movie_url, title, mode, current_save_path, year, state))
+
+    # A sync that stopped early hasn't walked the whole year
+    if state and not caught_up and (incremental or not year_already_scanned):
+        state.mark_year_complete(year, mode)
 
-    # Save Year Report
+    # Save Year Report (in prod the store holds every movie of the year, not just this run's)
+    if state:
+        report_data = [f"[{status}] Movie: {title} | URL: {url}" for status, title, url in state.year_entries(year)]
     report_name = f"verified_list_{year}.txt" if mode == "test" else f"download_report_{year}.txt"
     final_report_path = os.path.join(current_save_path, report_name)
     
@@ -141,13 +215,20 @@ def process_single_year(year, mode):
     
     return f"Year {year} complete. Movies: {len(report_data)}"
 
-def run_multithreaded_years(mode="test"):
+def run_multithreaded_years(mode="test", incremental=False):
+    site_client.apply_settings(globals())
     print(f"Starting Multi-Year Scrape (Mode: {mode})")
-    print(f"Parallel Years: {MAX_YEARS_AT_ONCE}")
+    print(f"Parallel Years: {MAX_YEARS_AT_ONCE} (movies at once: adaptive, starting at {INITIAL_MOVIES})")
+
+    state = None
+    if mode != "test":
+        os.makedirs(ROOT_DOWNLOAD_FOLDER, exist_ok=True)
+        state = crawl_state.CrawlState(STATE_DB_PATH)
+        LIBRARY.reset()
     
     # ThreadPoolExecutor is now at the YEAR level
     with ThreadPoolExecutor(max_workers=MAX_YEARS_AT_ONCE) as executor:
-        future_to_year = {executor.submit(process_single_year, year, mode): year for year in YEARS_TO_DOWNLOAD}
+        future_to_year = {executor.submit(process_single_year, year, mode, state, incremental): year for year in YEARS_TO_DOWNLOAD}
         
         for future in as_completed(future_to_year):
             year_completed = future_to_year[future]
@@ -156,7 +237,49 @@ def run_multithreaded_years(mode="test"):
                 print(f"FINISH: {result}")
             except Exception as e:
                 print(f"ERROR processing year {year_completed}: {e}")
+    SESSIONS.report()
+    MOVIE_LIMIT.report()
+
+def run_sharded_worker(mode="prod", incremental=False, publish=True, new_sweep=False):
+    """One of several processes or machines splitting a sweep through the lease
+    queue at WORK_QUEUE_PATH on the shared volume. Each worker claims whole years,
+    MAX_YEARS_AT_ONCE at a time, so no year is downloaded twice; a year whose
+    worker dies is picked up by another once its lease expires, resuming the
+    .part files left behind. publish=True queues YEARS_TO_DOWNLOAD first (years
+    already in the queue are left as they are), so every worker can be started
+    the same way.
+
+    Test, prod and incremental runs are queued apart, so one kind of sweep never
+    counts as done for another. Years stay done once a sweep has finished them:
+    new_sweep=True queues the finished ones again, for the one worker that starts
+    the next sweep (e.g. the nightly sync); the others join it without."""
+    site_client.apply_settings(globals())
+    print(f"Starting Sharded Worker (Mode: {mode})")
+    os.makedirs(ROOT_DOWNLOAD_FOLDER, exist_ok=True)
+    queue = work_queue.LeaseQueue(WORK_QUEUE_PATH)
+    kind = f"year:{mode}:incremental" if incremental else f"year:{mode}"
+    LIBRARY.reset()
+    if new_sweep:
+        print(f"Requeued {queue.reset(kind)} years finished by the last sweep")
+    if publish:
+        print(f"Queued {queue.publish(kind, YEARS_TO_DOWNLOAD)} new years")
+
+    state = None
+    if mode != "test":
+        # One store on the share for every host, so completed files and the dedup index are seen by all
+        state = crawl_state.CrawlState(STATE_DB_PATH)
+
+    def handle_year(year):
+        print(f"FINISH: {process_single_year(year, mode, state, incremental)}")
+
+    work_queue.run_workers(queue, kind, handle_year, MAX_YEARS_AT_ONCE)
+    print(f"Queue drained: {queue.counts(kind)}")
+    SESSIONS.report()
+    MOVIE_LIMIT.report()
 
 if __name__ == "__main__":
     # Use "prod" to download, "test" to just list
+    # incremental=True for the nightly sync of recent years
+    # run_sharded_worker() instead, on each host, to split the sweep between them
+    # (new_sweep=True on the first host of each new sweep)
     run_multithreaded_years(mode="prod")
\ No newline at end of file
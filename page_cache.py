@@ -0,0 +1,180 @@
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tamil-music-scraper", "pages")
+MAX_CACHE_BYTES = 512 * 1024 * 1024   # Compressed bodies kept on disk before LRU eviction
+DEFAULT_TTL = 24 * 3600
+# First matching pattern wins. Old decades never change, so they are trusted for
+# a long time; recent years are revalidated more often. Movie pages are only read
+# once per run, so no script sends them through the cache.
+TTL_RULES = [
+    (r"/browse-by-year/(19\d\d|200\d|201\d)\b", 30 * 24 * 3600),
+    (r"/browse-by-year/", 6 * 3600),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url           TEXT PRIMARY KEY,
+    key           TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    stored_at     REAL,
+    last_access   REAL,
+    size          INTEGER
+);
+CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+"""
+
+class PageUnavailable(Exception):
+    """The server answered with something other than the page or a 404 (a 403
+    challenge, say). Unlike a 404 this says nothing about whether the page exists."""
+
+    def __init__(self, url, status):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+# --- CACHE ---
+
+class PageCache:
+    """Persistent HTML cache: zlib bodies on disk, validators and LRU data in SQLite.
+    Fresh entries are served without a request; stale ones are revalidated with
+    If-None-Match / If-Modified-Since so unchanged pages cost a bodiless 304."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, ttl_rules=TTL_RULES,
+                 default_ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"),
+                                    check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def ttl_for(self, url):
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".z")
+
+    def _lookup(self, url):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT key, etag, last_modified, stored_at FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def _read_body(self, url, key):
+        try:
+            with open(self._body_path(key), "rb") as f:
+                body = zlib.decompress(f.read()).decode("utf-8")
+        except (OSError, zlib.error):
+            self._forget(url)
+            return None
+        with self.lock:
+            self.conn.execute("UPDATE pages SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+        return body
+
+    def _store(self, url, text, etag, last_modified):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(text.encode("utf-8"), 6)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, key, etag, last_modified, stored_at, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (url, key, etag, last_modified, now, now, len(data)))
+            self.conn.commit()
+            self.total_bytes += len(data) - (old[0] if old else 0)
+        self._evict()
+
+    def _touch(self, url):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("UPDATE pages SET stored_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self.conn.commit()
+
+    def _forget(self, url):
+        with self.lock:
+            row = self.conn.execute("SELECT key, size FROM pages WHERE url = ?", (url,)).fetchone()
+            if not row: return
+            self.conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self.conn.commit()
+            self.total_bytes -= row[1]
+        try:
+            os.remove(self._body_path(row[0]))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drops least recently used pages until the cache is back under 90% of its limit."""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        with self.lock:
+            rows = self.conn.execute("SELECT url, key, size FROM pages ORDER BY last_access").fetchall()
+            victims = []
+            for url, key, size in rows:
+                if self.total_bytes <= target: break
+                victims.append((url, key))
+                self.total_bytes -= size
+            self.conn.executemany("DELETE FROM pages WHERE url = ?", [(url,) for url, _ in victims])
+            self.conn.commit()
+        for _, key in victims:
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    def get_text(self, url, fetch):
+        """Returns the page HTML, or None if the page doesn't exist (404); any other
+        status raises PageUnavailable. fetch(url, extra_headers) performs the real
+        request and returns a requests-style response; it is only called on a miss
+        or when a stale entry needs revalidating."""
+        row = self._lookup(url)
+        extra_headers = {}
+        if row:
+            key, etag, last_modified, stored_at = row
+            if time.time() - stored_at < self.ttl_for(url):
+                body = self._read_body(url, key)
+                if body is not None:
+                    return body
+            if etag: extra_headers["If-None-Match"] = etag
+            if last_modified: extra_headers["If-Modified-Since"] = last_modified
+
+        response = fetch(url, extra_headers)
+        if response.status_code == 304 and row:
+            body = self._read_body(url, row[0])
+            if body is not None:
+                self._touch(url)
+                return body
+            # Body vanished from disk: fetch it again without validators
+            response = fetch(url, {})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise PageUnavailable(url, response.status_code)
+
+        text = response.text
+        self._store(url, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return text
@@ -1,74 +1,72 @@
 import os
-import time
-import cloudscraper
 import re
-from bs4 import BeautifulSoup
-import requests
+import rate_limiter
+import downloads
+import retry
+import page_cache
+import session_pool
+import site_client
+import link_extract
+import library
 
 # --- CONFIGURATION ---
 START_YEAR = 2005
 END_YEAR = 2026
+SITE_URL = "https://www.masstamilan.dev"
 ROOT_DOWNLOAD_FOLDER = r"Z:\music"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Referer": "https://www.google.com/",
 }
 
+PAGE_REQUESTS_PER_SEC = 1.0  # Shared by every worker, per host
+PAGE_BURST = 2
+DOWNLOADS_PER_SEC = 0.5
+DOWNLOAD_BURST = 1
+
 YEARS_TO_DOWNLOAD = [str(y) for y in range(START_YEAR, END_YEAR + 1)]
-scraper = cloudscraper.create_scraper()
+PAGE_CACHE = page_cache.PageCache()
+SESSIONS = session_pool.SessionPool(lambda: site_client.new_session(SITE_URL, HEADERS))
+LIBRARY = library.Library()
 
 # --- HELPER FUNCTIONS ---
 
-def get_soup(url):
-    try:
-        time.sleep(1.2) 
-        response = scraper.get(url, headers=HEADERS, timeout=15)
-        if response.status_code == 200:
-            return BeautifulSoup(response.text, 'html.parser')
-        return None
-    except Exception:
-        return None
+def fetch_page(url, extra_headers):
+    return site_client.fetch_page(SESSIONS, url, {**HEADERS, **extra_headers})
+
+def get_html(url):
+    return site_client.get_html(PAGE_CACHE, fetch_page, url)
 
 def download_movie_content(movie_url, year_path):
-    soup = get_soup(movie_url)
-    if not soup: return False
+    resolved = site_client.resolve_download_link(SESSIONS, fetch_page, movie_url, HEADERS)
+    if not resolved:
+        print("      [!] Couldn't load the movie page")
+        return False
 
-    target_link = None
-    file_type = ""
-    
     base_name = movie_url.split('/')[-1].split('?')[0]
     movie_name = re.sub(r'[\\/*?:"<>|]', "", base_name).replace("-", "_")
 
-    all_links = soup.find_all('a', href=True)
-    for a in all_links:
-        if "zip320" in a['href']:
-            target_link = requests.compat.urljoin(movie_url, a['href'])
-            file_type = "zip"
-            break
-            
-    if not target_link:
-        for a in all_links:
-            if "d320" in a['href']:
-                target_link = requests.compat.urljoin(movie_url, a['href'])
-                file_type = "mp3"
-                break
+    # The album zip320 wins over a single d320 song
+    target_link, file_type = resolved
 
     if target_link:
         ext = ".zip" if file_type == "zip" else ".mp3"
         filename = f"{movie_name}_320kbps{ext}"
         save_path = os.path.join(year_path, filename)
         
-        if os.path.exists(save_path):
+        if LIBRARY.has(save_path):
             print(f"      [-] Skipping: {filename}")
             return True
 
         try:
             print(f"      [*] Downloading {filename}...")
-            with scraper.get(target_link, headers=HEADERS, stream=True) as r:
-                r.raise_for_status()
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        if chunk: f.write(chunk)
+            def attempt():
+                rate_limiter.acquire(target_link, "download")
+                # Streams into a .part file and resumes it if an earlier run was cut off
+                with SESSIONS.session() as session:
+                    return downloads.download_file(session, target_link, save_path, HEADERS)
+            retry.call(target_link, attempt)
+            LIBRARY.add(save_path)
             print(f"      [SUCCESS]")
             return True
         except Exception as e:
@@ -79,16 +77,17 @@ def download_movie_content(movie_url, year_path):
 # --- MAIN EXECUTION ---
 
 def run_yearly_automated_scrape(mode="test"):
-    
+    site_client.apply_settings(globals())
+    LIBRARY.reset()
     test_dir = os.path.join(ROOT_DOWNLOAD_FOLDER, "test_reports")
-    
+
     if mode == "test":
         os.makedirs(test_dir, exist_ok=True)
         print(f"TEST MODE: Reports saved to {test_dir}")
         print("\nprogressing......")
 
     for year in YEARS_TO_DOWNLOAD:
-        year_base_url = f"https://www.masstamilan.dev/browse-by-year/{year}"
+        year_base_url = f"{SITE_URL}/browse-by-year/{year}"
         
         if mode == "test":
             current_save_path = test_dir
@@ -103,41 +102,26 @@ def run_yearly_automated_scrape(mode="test"):
         global_seen_urls = set()
         report_entries = []
 
-        while True:
-            page_url = f"{year_base_url}?page={current_page}"
-            soup = get_soup(page_url)
-            if not soup: break
-
-            # Specifically target the grid structure observed in your screenshots
-            main_grid = soup.find('div', class_='gw') or soup.find('section', class_='bots')
-            if not main_grid: break
-
-            # Find each movie block (usually div with class a-i or similar)
-            movie_blocks = main_grid.find_all('div', class_='a-i')
-            
-            # Fallback if specific div blocks aren't found
-            if not movie_blocks:
-                links = main_grid.find_all('a', href=True)
-            else:
-                links = [block.find('a', href=True) for block in movie_blocks if block.find('a', href=True)]
-
-            found_new_on_page = False
-            for a in links:
-                href = a['href']
-                # Get the full text for the metadata spacing
-                raw_text = a.get_text(separator="\n").strip() 
-                
-                if "-songs" in href and raw_text and "browse-by-year" not in href:
-                    full_url = requests.compat.urljoin(page_url, href)
+        listing_error = None
+        try:
+            while True:
+                page_url = f"{year_base_url}?page={current_page}"
+                html = get_html(page_url)
+                if html is None: break
+
+                # One entry per movie card in the grid (div.a-i), with the lines under its title
+                entries, _ = link_extract.extract_listing_entries(html, page_url)
+                if not entries: break
+
+                found_new_on_page = False
+                for full_url, movie_title, details in entries:
                     if full_url not in global_seen_urls:
                         global_seen_urls.add(full_url)
                         found_new_on_page = True
-                        
+
                         # Formatting the entry with specific spacing
-                        # We split by newlines to separate Movie Name from Starring/Director info
-                        lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
-                        movie_title = lines[0] if lines else "Unknown Movie"
-                        metadata = " | ".join(lines[1:]) if len(lines) > 1 else ""
+                        # Starring/Director info goes on one line after the Movie Name
+                        metadata = " | ".join(details)
 
                         if mode == "test":
                             entry = f"MOVIE: {movie_title}\nDETAILS: {metadata}\nURL: {full_url}\n{'-'*40}"
@@ -148,8 +132,12 @@ def run_yearly_automated_scrape(mode="test"):
                             entry = f"[{status}] MOVIE: {movie_title}\nURL: {full_url}\n{'-'*40}"
                             report_entries.append(entry)
 
-            if not found_new_on_page: break
-            current_page += 1
+                if not found_new_on_page: break
+                current_page += 1
+        except Exception as e:
+            # A 403 or a server that kept failing isn't the end of the list: say so in the report
+            listing_error = e
+            print(f"ERROR processing year {year}: {e}")
 
         # Save report with refined spacing
         report_name = f"verified_list_{year}.txt" if mode == "test" else f"download_report_{year}.txt"
@@ -158,6 +146,8 @@ def run_yearly_automated_scrape(mode="test"):
         with open(final_report_path, "w", encoding="utf-8") as f:
             f.write(f"--- {mode.upper()} REPORT FOR {year} ---\n")
             f.write(f"Total Unique Movies Found: {len(report_entries)}\n")
+            if listing_error:
+                f.write(f"INCOMPLETE: listing stopped at page {current_page}: {listing_error}\n")
             f.write("="*60 + "\n\n")
             f.write("\n\n".join(report_entries)) # Double spacing between movies
         
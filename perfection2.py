@@ -1,163 +1,295 @@
 import os
-import time
-import cloudscraper
+import session_pool
+import site_client
 import re
-from bs4 import BeautifulSoup
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import rate_limiter
+import retry
+import segmented
+import dedup
+import page_cache
+import year_scanner
+import crawl_state
+import pipeline
+import concurrency
+import bandwidth
+import upstream_check
+import library
 
 # --- CONFIGURATION ---
 START_YEAR = 2000
 END_YEAR =  2026
+SITE_URL = "https://www.masstamilan.dev"
 ROOT_DOWNLOAD_FOLDER = r"/mnt/storage/music"
-MAX_WORKERS = 5  # Number of simultaneous downloads/requests
+MAX_WORKERS = 16  # Download threads; how many run at once is adapted by DOWNLOAD_LIMIT
+INITIAL_DOWNLOADS = 5  # Simultaneous downloads to start from
+LISTING_WORKERS = 4  # Listing pages fetched at once within a year
+YEAR_WORKERS = 2  # Years being discovered at the same time
+RESOLVE_WORKERS = 4  # Movie pages being searched for zip320/d320 links
+RESOLVE_QUEUE_SIZE = 200  # Discovered movies waiting for link resolution
+DOWNLOAD_QUEUE_SIZE = 200  # Resolved links waiting for a download slot, picked from in DOWNLOAD_ORDER
+STATE_DB_PATH = os.path.join(ROOT_DOWNLOAD_FOLDER, "crawl_state.sqlite3")
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Referer": "https://www.google.com/",
 }
 
+PAGE_REQUESTS_PER_SEC = 2.0  # Shared by every worker, per host
+PAGE_BURST = 4
+DOWNLOADS_PER_SEC = 0.5
+DOWNLOAD_BURST = 2
+PROBES_PER_SEC = 2.0  # HEADs of download links for sizes and audits, paced apart from pages and downloads
+PROBE_BURST = 4
+SEGMENTS_PER_FILE = 4  # Parallel byte ranges per large file
+MAX_SEGMENT_CONNECTIONS = 16  # Segment connections across all downloads
+PARSE_PROCESSES = 0  # >0 parses pages in worker processes instead of the I/O threads
+MAX_DOWNLOAD_BYTES_PER_SEC = 0  # Cap on all downloads together, shared fairly between years; 0 = no cap
+BANDWIDTH_SCHEDULE = []  # (start_hour, end_hour, bytes_per_sec) overrides, e.g. [(9, 18, 4 * 1024 * 1024)] in office hours
+YEAR_WEIGHTS = {}  # Share of the cap per year relative to the others (default 1), e.g. {"2024": 2}
+VERIFY_EXISTING = False  # Audit files on disk against a HEAD of their link (size, ETag/Last-Modified) instead of trusting the name
+DOWNLOAD_ORDER = "smallest"  # Queued downloads: "smallest" file, "newest" year, "fixed" (YEAR_PRIORITY) first, or "listing"
+YEAR_PRIORITY = {}  # For "fixed": lower goes first, e.g. {"2026": 0, "2025": 1}; unlisted years come last
+
 YEARS_TO_DOWNLOAD = [str(y) for y in range(START_YEAR, END_YEAR + 1)]
-scraper = cloudscraper.create_scraper()
+PAGE_CACHE = page_cache.PageCache()
+# Grows while downloads go well, halves on 429/503s and timeouts from the download host
+DOWNLOAD_LIMIT = concurrency.AdaptiveLimit("downloads", INITIAL_DOWNLOADS, maximum=MAX_WORKERS)
+SESSIONS = session_pool.SessionPool(lambda: site_client.new_session(SITE_URL, HEADERS))
+LIBRARY = library.Library()
 
 # --- HELPER FUNCTIONS ---
 
-def get_soup(url):
-    try:
-        # Reduced sleep slightly as threads will distribute the load
-        time.sleep(0.5) 
-        response = scraper.get(url, headers=HEADERS, timeout=15)
-        if response.status_code == 200:
-            return BeautifulSoup(response.text, 'html.parser')
-        return None
-    except Exception:
-        return None
+def fetch_page(url, extra_headers):
+    return site_client.fetch_page(SESSIONS, url, {**HEADERS, **extra_headers})
 
-def download_movie_content(movie_url, year_path):
-    """Function to be executed by threads for actual downloading"""
-    soup = get_soup(movie_url)
-    if not soup: return False
+def get_html(url):
+    return site_client.get_html(PAGE_CACHE, fetch_page, url)
+
+def record_result(state, movie_url, status, num_bytes=None, error=None):
+    if state: state.record_result(movie_url, status, num_bytes, error)
+
+def resolve_movie_link(movie_url, year_path, state=None):
+    """Finds the album zip (or single mp3) on a movie page.
+    Returns (target_link, save_path) or None."""
+    resolved = site_client.resolve_download_link(SESSIONS, fetch_page, movie_url, HEADERS)
+    if not resolved:
+        record_result(state, movie_url, "FAILED", error="movie page unavailable")
+        return None
 
-    target_link = None
-    file_type = ""
-    
     base_name = movie_url.split('/')[-1].split('?')[0]
     movie_name = re.sub(r'[\\/*?:"<>|]', "", base_name).replace("-", "_")
 
-    all_links = soup.find_all('a', href=True)
-    # Search for ZIP first, then MP3
-    for a in all_links:
-        if "zip320" in a['href']:
-            target_link = requests.compat.urljoin(movie_url, a['href'])
-            file_type = "zip"
-            break
-            
+    # The album zip320 wins over a single d320 song
+    target_link, file_type = resolved
+
     if not target_link:
-        for a in all_links:
-            if "d320" in a['href']:
-                target_link = requests.compat.urljoin(movie_url, a['href'])
-                file_type = "mp3"
-                break
-
-    if target_link:
-        ext = ".zip" if file_type == "zip" else ".mp3"
-        filename = f"{movie_name}_320kbps{ext}"
-        save_path = os.path.join(year_path, filename)
-        
-        if os.path.exists(save_path):
+        record_result(state, movie_url, "FAILED", error="no zip320/d320 link")
+        return None
+
+    ext = ".zip" if file_type == "zip" else ".mp3"
+    save_path = os.path.join(year_path, f"{movie_name}_320kbps{ext}")
+    try:
+        if state: state.record_resolved(movie_url, target_link, file_type, save_path)
+    except Exception as e:
+        print(f"      [!] Failed {os.path.basename(save_path)}: {e}")
+        record_result(state, movie_url, "FAILED", error=str(e))
+        return None
+    return target_link, save_path
+
+def probe_size(target_link, save_path):
+    """segmented.probe() of the file behind target_link, for ordering the download
+    queue; None when it wasn't probed or the probe failed, so the download probes again."""
+    if DOWNLOAD_ORDER == "listing" or LIBRARY.has(save_path):
+        return None
+    rate_limiter.acquire(target_link, "probe")
+    with SESSIONS.session() as session:
+        return segmented.probe(session, target_link, HEADERS)
+
+def download_priority(item):
+    """Sort key for a queued (movie_url, target_link, save_path, probed) download."""
+    movie_url, target_link, save_path, probed = item
+    year = os.path.basename(os.path.dirname(save_path))
+    # Files already on disk are only skip checks, so they go first; unknown sizes go last
+    if LIBRARY.has(save_path):
+        size = 0
+    else:
+        size = probed[0] if probed and probed[0] is not None else float("inf")
+    if DOWNLOAD_ORDER == "newest":
+        return (-int(year) if year.isdigit() else 0, size)
+    if DOWNLOAD_ORDER == "fixed":
+        return (YEAR_PRIORITY.get(year, float("inf")), size)
+    return size
+
+def fetch_movie_file(movie_url, target_link, save_path, state=None, probed=None):
+    filename = os.path.basename(save_path)
+    year = os.path.basename(os.path.dirname(save_path))
+    try:
+        # A wrong-sized or changed file is resumed or fetched again below
+        if LIBRARY.has(save_path) and (not VERIFY_EXISTING or
+                site_client.verify_existing(SESSIONS, LIBRARY, state, target_link, save_path, HEADERS)):
             print(f"      [-] Skipping: {filename}")
+            record_result(state, movie_url, "SUCCESS")
             return True
 
-        try:
-            print(f"      [*] Downloading {filename}...")
-            with scraper.get(target_link, headers=HEADERS, stream=True) as r:
-                r.raise_for_status()
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        if chunk: f.write(chunk)
-            print(f"      [SUCCESS] Finished {filename}")
-            return True
-        except Exception as e:
-            print(f"      [!] Failed {filename}: {e}")
-            return False
-    return False
+        print(f"      [*] Downloading {filename}...")
+        def attempt():
+            rate_limiter.acquire(target_link, "download")
+            # The download counts against this year's share of the bandwidth cap
+            with SESSIONS.session() as session, bandwidth.flow(year):
+                # Resumes a cut-off run, splits large files into byte ranges on pooled sessions
+                # of their own, and hardlinks content already stored under another name
+                return dedup.download(state, session, target_link, save_path, HEADERS, SEGMENTS_PER_FILE,
+                                      probed, pool=SESSIONS)
+        with DOWNLOAD_LIMIT.slot(target_link):
+            written = retry.call(target_link, attempt)
+            DOWNLOAD_LIMIT.add_bytes(written)
+        LIBRARY.add(save_path)
+        print(f"      [SUCCESS] Finished {filename}")
+        record_result(state, movie_url, "SUCCESS", written)
+        return True
+    except Exception as e:
+        print(f"      [!] Failed {filename}: {e}")
+        record_result(state, movie_url, "FAILED", error=str(e))
+        return False
+
+def download_movie_content(movie_url, year_path, state=None):
+    """Resolves and downloads one movie in the calling thread"""
+    resolved = resolve_movie_link(movie_url, year_path, state)
+    if not resolved: return False
+    target_link, save_path = resolved
+    return fetch_movie_file(movie_url, target_link, save_path, state)
 
 # --- MAIN EXECUTION ---
 
-def process_movie(movie_info, mode, current_save_path):
-    """Wrapper for the worker threads to return status and data"""
-    movie_url, title = movie_info
+def year_save_path(year, mode):
     if mode == "test":
-        return f"Movie: {title} | URL: {movie_url}"
-    else:
-        success = download_movie_content(movie_url, current_save_path)
-        status = "SUCCESS" if success else "FAILED"
-        return f"[{status}] Movie: {title} | URL: {movie_url}"
+        return os.path.join(ROOT_DOWNLOAD_FOLDER, "test_reports")
+    return os.path.join(ROOT_DOWNLOAD_FOLDER, year)
 
-def run_yearly_automated_scrape(mode="test"):
+def write_year_report(year, mode, current_save_path, report_data):
+    report_name = f"verified_list_{year}.txt" if mode == "test" else f"download_report_{year}.txt"
+    final_report_path = os.path.join(current_save_path, report_name)
+    
+    with open(final_report_path, "w", encoding="utf-8") as f:
+        f.write(f"--- {mode.upper()} REPORT FOR {year} ---\n")
+        f.write(f"Total Movies Found: {len(report_data)}\n\n")
+        f.write("\n".join(report_data))
+    
+    print(f"Done with {year}. Unique Movies Processed: {len(report_data)}")
+
+def run_yearly_automated_scrape(mode="test", incremental=False):
+    """Runs the crawl as three stages joined by bounded queues:
+    year discovery -> movie link resolution -> file download.
+    Each stage has its own workers, so a slow 300 MB zip only holds up one
+    download slot while discovery and resolution keep going.
+
+    incremental=True is the nightly sync: each year's listing is only walked
+    until a page holds nothing but movies already in the crawl state."""
+    site_client.apply_settings(globals())
     test_dir = os.path.join(ROOT_DOWNLOAD_FOLDER, "test_reports")
     
     if mode == "test":
         os.makedirs(test_dir, exist_ok=True)
         print(f"TEST MODE: All reports will be saved to {test_dir}")
+        state = None
+        if incremental: print("Incremental mode needs the crawl state, listing everything instead")
+        incremental = False
+    else:
+        os.makedirs(ROOT_DOWNLOAD_FOLDER, exist_ok=True)
+        state = crawl_state.CrawlState(STATE_DB_PATH)
+        LIBRARY.reset()
 
-    for year in YEARS_TO_DOWNLOAD:
-        year_base_url = f"https://www.masstamilan.dev/browse-by-year/{year}"
-        
-        if mode == "test":
-            current_save_path = test_dir
-        else:
-            current_save_path = os.path.join(ROOT_DOWNLOAD_FOLDER, year)
-            os.makedirs(current_save_path, exist_ok=True)
+    # Test mode only lists movies; those entries are collected here per year
+    test_entries = {year: [] for year in YEARS_TO_DOWNLOAD}
+
+    def discover_year(year, emit):
+        year_base_url = f"{SITE_URL}/browse-by-year/{year}"
+        current_save_path = year_save_path(year, mode)
+        os.makedirs(current_save_path, exist_ok=True)
+        print(f"--- DISCOVERING {mode.upper()} FOR YEAR: {year} ---")
+
+        # Completed movies' files are checked against upstream; mismatches rejoin the unfinished ones
+        if VERIFY_EXISTING and state:
+            upstream_check.audit_year(
+                state, year,
+                lambda link, path: site_client.verify_existing(SESSIONS, LIBRARY, state, link, path, HEADERS),
+                LIBRARY.has)
+
+        # Year pages were fully walked on an earlier run: retry what is unfinished,
+        # and outside incremental mode don't look at the listing again
+        year_already_scanned = bool(state and state.is_year_complete(year, mode))
+        if year_already_scanned or incremental:
+            pending = state.pending_movies(year)
+            print(f"    [-] {year}: retrying {len(pending)} unfinished movies from earlier runs")
+            for movie_url, title in pending:
+                emit((movie_url, current_save_path))
+        if year_already_scanned and not incremental:
+            return
 
-        print(f"\n" + "="*60)
-        print(f"--- PROCESSING {mode.upper()} FOR YEAR: {year} ---")
-        
-        current_page = 1
         global_seen_urls = set()
-        report_data = []
-
-        # ThreadPoolExecutor handles the parallel execution
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            while True:
-                page_url = f"{year_base_url}?page={current_page}"
-                soup = get_soup(page_url)
-                if not soup: break
-
-                main_grid = soup.find('div', class_='gw') or soup.find('section', class_='bots')
-                if not main_grid: break
-
-                page_movies = []
-                for a in main_grid.find_all('a', href=True):
-                    href = a['href']
-                    text = a.text.strip()
-                    if "-songs" in href and text and "browse-by-year" not in href:
-                        full_url = requests.compat.urljoin(page_url, href)
-                        if full_url not in global_seen_urls:
-                            page_movies.append((full_url, text))
-                            global_seen_urls.add(full_url)
-
-                if not page_movies: break
-
-                # Map the movies on this page to worker threads
-                future_to_movie = {executor.submit(process_movie, movie, mode, current_save_path): movie for movie in page_movies}
-                
-                for future in as_completed(future_to_movie):
-                    result = future.result()
-                    report_data.append(result)
-                
-                current_page += 1
-
-        # Save Report
-        report_name = f"verified_list_{year}.txt" if mode == "test" else f"download_report_{year}.txt"
-        final_report_path = os.path.join(current_save_path, report_name)
-        
-        with open(final_report_path, "w", encoding="utf-8") as f:
-            f.write(f"--- {mode.upper()} REPORT FOR {year} ---\n")
-            f.write(f"Total Movies Found: {len(report_data)}\n\n")
-            f.write("\n".join(report_data))
-        
-        print(f"Done with {year}. Unique Movies Processed: {len(report_data)}")
+        known_urls = state.known_urls(year) if incremental else set()
+        caught_up = False
+        # Page 1 gives the page count, the rest of the listing is fetched concurrently
+        listing_workers = 1 if incremental else LISTING_WORKERS
+        for current_page, page_links in year_scanner.iter_year_pages(year_base_url, get_html, listing_workers):
+            page_movies = []
+            for full_url, text in page_links:
+                if full_url not in global_seen_urls:
+                    page_movies.append((full_url, text))
+                    global_seen_urls.add(full_url)
+
+            if not page_movies: break
+
+            if incremental:
+                # Known movies were handled above; a page of only known ones means we're caught up
+                page_movies = [m for m in page_movies if m[0] not in known_urls]
+                if not page_movies:
+                    print(f"    [-] {year}: page {current_page} has no new movies, stopping sync")
+                    caught_up = True
+                    break
+
+            if mode == "test":
+                test_entries[year].extend(f"Movie: {title} | URL: {movie_url}" for movie_url, title in page_movies)
+                continue
+
+            for movie_url, title in page_movies:
+                state.record_discovered(movie_url, year, title)
+                # Completed movies from earlier runs are recorded but not re-fetched
+                if not state.is_completed(movie_url):
+                    emit((movie_url, current_save_path))
+
+        # A sync that stopped early hasn't walked the whole year
+        if state and not caught_up: state.mark_year_complete(year, mode)
+
+    def resolve_movie(item, emit):
+        movie_url, current_save_path = item
+        resolved = resolve_movie_link(movie_url, current_save_path, state)
+        if resolved:
+            # Sized now so the download queue can put small albums ahead of big ones
+            emit((movie_url, *resolved, probe_size(*resolved)))
+
+    def download_movie(item, emit):
+        movie_url, target_link, save_path, probed = item
+        fetch_movie_file(movie_url, target_link, save_path, state, probed)
+
+    stages = [
+        pipeline.Stage("discovery", discover_year, YEAR_WORKERS),
+        pipeline.Stage("resolve", resolve_movie, RESOLVE_WORKERS, RESOLVE_QUEUE_SIZE),
+        pipeline.Stage("download", download_movie, MAX_WORKERS, DOWNLOAD_QUEUE_SIZE,
+                       None if DOWNLOAD_ORDER == "listing" else download_priority),
+    ]
+    pipeline.run_pipeline(stages, YEARS_TO_DOWNLOAD)
+
+    # Save Reports (in prod the store holds every movie of the year, not just this run's)
+    for year in YEARS_TO_DOWNLOAD:
+        if state:
+            report_data = [f"[{status}] Movie: {title} | URL: {url}" for status, title, url in state.year_entries(year)]
+        else:
+            report_data = test_entries[year]
+        write_year_report(year, mode, year_save_path(year, mode), report_data)
+    SESSIONS.report()
+    DOWNLOAD_LIMIT.report()
 
 if __name__ == "__main__":
     # Change to "prod" or similar to actually download
-    run_yearly_automated_scrape(mode="prod")
\ No newline at end of file
+    # incremental=True for the nightly sync of recent years
+    run_yearly_automated_scrape(mode="prod")
@@ -0,0 +1,88 @@
+import queue
+import itertools
+import threading
+
+_DONE = object()
+
+# --- STAGES ---
+
+class Stage:
+    """A pool of worker threads fed by a bounded queue.
+
+    handler(item, emit) does the stage's work and may call emit() any number of
+    times to hand items to the next stage. emit() blocks while the next stage's
+    queue is full, so a slow stage pushes back on the ones before it instead of
+    letting work pile up in memory.
+
+    With priority(item), queued items are taken lowest value first (ties in
+    arrival order) instead of first in, first out."""
+
+    def __init__(self, name, handler, workers, queue_size=0, priority=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.priority = priority
+        self.queue = queue.PriorityQueue(maxsize=queue_size) if priority else queue.Queue(maxsize=queue_size)
+        self.sequence = itertools.count()
+        self.next_stage = None
+        self.threads = []
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def put(self, item):
+        if self.priority:
+            # Stop markers sort after every real item
+            rank = (1, 0) if item is _DONE else (0, self.priority(item))
+            item = (rank, next(self.sequence), item)
+        self.queue.put(item)
+
+    def get(self):
+        item = self.queue.get()
+        return item[-1] if self.priority else item
+
+    def emit(self, item):
+        if self.next_stage is not None:
+            self.next_stage.put(item)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def _work(self):
+        while True:
+            item = self.get()
+            if item is _DONE:
+                return
+            try:
+                self.handler(item, self.emit)
+                with self.lock: self.processed += 1
+            except Exception as e:
+                with self.lock: self.failed += 1
+                print(f"      [!] {self.name} failed on {item!r}: {e}")
+
+    def finish(self):
+        """Waits for every queued item to be handled, then stops the workers."""
+        for _ in self.threads:
+            self.put(_DONE)
+        for t in self.threads:
+            t.join()
+
+# --- PIPELINE ---
+
+def run_pipeline(stages, items):
+    """Chains the stages, feeds items into the first one and drains them in order."""
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage.next_stage = next_stage
+    for stage in stages:
+        stage.start()
+
+    for item in items:
+        stages[0].put(item)
+
+    # A stage can only stop once everything upstream of it has stopped emitting
+    for stage in stages:
+        stage.finish()
+        print(f"    [{stage.name}] done: {stage.processed} ok, {stage.failed} failed")
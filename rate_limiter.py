@@ -0,0 +1,89 @@
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+# --- CONFIGURATION ---
+# Budgets are per host. HTML pages, file downloads and HEAD probes of files (size
+# checks, audits) are paced separately so a burst of one never eats into the others.
+DEFAULT_BUDGETS = {
+    "page": (2.0, 4),       # (requests per second, burst)
+    "download": (0.5, 2),
+    "probe": (2.0, 4),
+}
+HOST_BUDGETS = {
+    # "www.masstamilan.dev": {"page": (3.0, 6)},
+}
+
+# --- TOKEN BUCKET ---
+
+class TokenBucket:
+    """Thread-safe token bucket. reserve() books a token and returns how long the
+    caller must wait for it, so sync and async callers share the same bucket."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# --- SHARED REGISTRY ---
+
+_buckets = {}
+_registry_lock = threading.Lock()
+
+def get_bucket(url, kind="page"):
+    """Returns the bucket shared by every worker for this host and traffic kind."""
+    host = urlsplit(url).hostname or ""
+    key = (host, kind)
+    with _registry_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            rate, burst = HOST_BUDGETS.get(host, {}).get(kind, DEFAULT_BUDGETS[kind])
+            bucket = TokenBucket(rate, burst)
+            _buckets[key] = bucket
+        return bucket
+
+def set_budget(kind, rate, burst, host=None):
+    """Changes a budget at runtime. Without a host it becomes the default."""
+    with _registry_lock:
+        if host is None:
+            DEFAULT_BUDGETS[kind] = (rate, burst)
+        else:
+            HOST_BUDGETS.setdefault(host, {})[kind] = (rate, burst)
+        for (bucket_host, bucket_kind), bucket in _buckets.items():
+            if bucket_kind != kind:
+                continue
+            if host is None and bucket_host in HOST_BUDGETS and kind in HOST_BUDGETS[bucket_host]:
+                continue
+            if host is None or bucket_host == host:
+                with bucket.lock:
+                    bucket.rate = float(rate)
+                    bucket.burst = float(burst)
+
+def acquire(url, kind="page"):
+    get_bucket(url, kind).acquire()
+
+async def async_acquire(url, kind="page"):
+    await get_bucket(url, kind).async_acquire()
@@ -0,0 +1,221 @@
+import time
+import random
+import asyncio
+import threading
+import email.utils
+import requests
+from urllib.parse import urlsplit
+
+# --- CONFIGURATION ---
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0       # Seconds before the first retry, doubled each attempt
+BACKOFF_CAP = 60.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+BREAKER_THRESHOLD = 5    # Consecutive retryable failures on a host before it trips
+BREAKER_COOLDOWN = 30.0  # Seconds every worker pauses once it has tripped
+BREAKER_COOLDOWN_CAP = 600.0
+# Exceptions (without an HTTP status) worth another attempt; see add_retryable()
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError, ConnectionError, TimeoutError)
+
+class RetryExhausted(Exception):
+    """A request kept failing with retryable errors. Unlike a 404 this does not
+    mean the page is missing, so callers must not treat it as end-of-list."""
+
+    def __init__(self, url, last_error, attempts=MAX_ATTEMPTS):
+        super().__init__(f"gave up on {url} after {attempts} attempts: {last_error}")
+        self.url = url
+        self.last_error = last_error
+
+# --- HELPER FUNCTIONS ---
+
+def retry_after_seconds(response):
+    """Retry-After as seconds (delta or HTTP date), or None."""
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def add_retryable(*exc_types):
+    """Treats more exception types as transient, e.g. another HTTP client's connection errors."""
+    global RETRYABLE_ERRORS
+    RETRYABLE_ERRORS = tuple(dict.fromkeys(RETRYABLE_ERRORS + exc_types))
+
+def status_of(outcome):
+    """HTTP status of a requests or aiohttp response, or of an error raised for
+    one (HTTPError.response, aiohttp's ClientResponseError.status); else None."""
+    for obj in (outcome, getattr(outcome, "response", None)):
+        status = getattr(obj, "status_code", None) or getattr(obj, "status", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+def is_retryable_error(exc):
+    status = status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(exc, RETRYABLE_ERRORS)
+
+def backoff_delay(attempt):
+    """Full jitter: anywhere between 0 and the exponential ceiling."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+# --- CIRCUIT BREAKER ---
+
+class CircuitBreaker:
+    """Per-host breaker. Once a host trips, every worker waits out the same
+    cooldown instead of each one hammering it with its own retries."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    async def async_wait(self):
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self, retry_after=None):
+        with self.lock:
+            self.failures += 1
+            now = time.monotonic()
+            if retry_after is not None:
+                # The server said how long to back off: every worker honours it
+                self.open_until = max(self.open_until, now + min(retry_after, BREAKER_COOLDOWN_CAP))
+            if self.failures >= self.threshold:
+                print(f"      [!] Circuit open for {self.cooldown:.0f}s after {self.failures} failures")
+                self.open_until = max(self.open_until, now + self.cooldown)
+                # Still failing once it re-closes: back off harder next time
+                self.cooldown = min(BREAKER_COOLDOWN_CAP, self.cooldown * 2)
+                self.failures = 0
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(url):
+    host = urlsplit(url).hostname or ""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+# --- LISTENERS ---
+
+_listeners = []
+
+def add_listener(listener):
+    """listener(url, outcome, elapsed) is called after every attempt, where outcome
+    is the HTTP status of the response or the exception the attempt raised."""
+    _listeners.append(listener)
+
+def notify(url, outcome, elapsed):
+    for listener in _listeners:
+        try:
+            listener(url, outcome, elapsed)
+        except Exception as e:
+            print(f"      [!] Retry listener failed: {e}")
+
+# --- RETRY ---
+
+def _failed_response(exc):
+    """What Retry-After is read from when an attempt raised."""
+    response = getattr(exc, "response", None)
+    return response if response is not None else exc
+
+def _pause_after_failure(breaker, response, attempt, max_attempts):
+    """Records a retryable failure; returns how long to back off before the next attempt."""
+    retry_after = retry_after_seconds(response)
+    breaker.record_failure(retry_after)
+    # A Retry-After pause is served by the breaker's wait on the next attempt
+    if retry_after is None and attempt + 1 < max_attempts:
+        return backoff_delay(attempt)
+    return 0
+
+def call(url, request_fn, max_attempts=MAX_ATTEMPTS):
+    """Runs request_fn() until it succeeds or fails for a non-retryable reason.
+
+    request_fn may return a requests-style response (retried on 429/5xx, anything
+    else such as a 404 is handed back as is) or raise (retried on timeouts,
+    connection errors and HTTPErrors with a retryable status). Raises
+    RetryExhausted when every attempt failed with a retryable error."""
+    breaker = breaker_for(url)
+    last_error = None
+    for attempt in range(max_attempts):
+        breaker.wait()
+        started = time.monotonic()
+        try:
+            result = request_fn()
+        except Exception as e:
+            notify(url, status_of(e) or e, time.monotonic() - started)
+            if not is_retryable_error(e):
+                raise
+            last_error = e
+            response = _failed_response(e)
+        else:
+            status = status_of(result)
+            notify(url, status, time.monotonic() - started)
+            if status not in RETRYABLE_STATUSES:
+                breaker.record_success()
+                return result
+            last_error = f"HTTP {status}"
+            response = result
+            if hasattr(result, "close"): result.close()
+
+        time.sleep(_pause_after_failure(breaker, response, attempt, max_attempts))
+    raise RetryExhausted(url, last_error, max_attempts)
+
+async def async_call(url, request_fn, max_attempts=MAX_ATTEMPTS):
+    """call() for asyncio: request_fn is a coroutine function, and the backoff and
+    breaker pauses are asyncio sleeps so the other tasks keep running meanwhile.
+    Shares the per-host breakers and listeners with the threaded callers."""
+    breaker = breaker_for(url)
+    last_error = None
+    for attempt in range(max_attempts):
+        await breaker.async_wait()
+        started = time.monotonic()
+        try:
+            result = await request_fn()
+        except Exception as e:
+            notify(url, status_of(e) or e, time.monotonic() - started)
+            if not is_retryable_error(e):
+                raise
+            last_error = e
+            response = _failed_response(e)
+        else:
+            status = status_of(result)
+            notify(url, status, time.monotonic() - started)
+            if status not in RETRYABLE_STATUSES:
+                breaker.record_success()
+                return result
+            last_error = f"HTTP {status}"
+            response = result
+            if hasattr(result, "close"): result.close()
+
+        await asyncio.sleep(_pause_after_failure(breaker, response, attempt, max_attempts))
+    raise RetryExhausted(url, last_error, max_attempts)
@@ -1,85 +1,82 @@
 import os
-import time
-import cloudscraper
 import re
-from bs4 import BeautifulSoup
-import requests
+import rate_limiter
+import downloads
+import retry
+import page_cache
+import session_pool
+import site_client
+import link_extract
+import library
+import work_queue
+import cancellation
 
 # --- CONFIGURATION ---
 START_YEAR = 1952
 END_YEAR = 2026
+SITE_URL = "https://www.masstamilan.dev"
 ROOT_DOWNLOAD_FOLDER = r"/mnt/storage2/media"
+WORK_QUEUE_PATH = os.path.join(ROOT_DOWNLOAD_FOLDER, "work_queue.sqlite3")  # Used with sharded=True
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Referer": "https://www.google.com/",
 }
 
+PAGE_REQUESTS_PER_SEC = 1.0  # Shared by every worker, per host
+PAGE_BURST = 2
+DOWNLOADS_PER_SEC = 0.5
+DOWNLOAD_BURST = 1
+
 YEARS_TO_DOWNLOAD = [str(y) for y in range(START_YEAR, END_YEAR + 1)]
-scraper = cloudscraper.create_scraper()
+PAGE_CACHE = page_cache.PageCache()
+SESSIONS = session_pool.SessionPool(lambda: site_client.new_session(SITE_URL, HEADERS))
+LIBRARY = library.Library()
 
 # --- HELPER FUNCTIONS ---
 
-def get_soup(url):
-    """Fetches HTML and converts to Soup. Linear execution."""
-    try:
-        # Standard delay to avoid IP blocks
-        time.sleep(1.2) 
-        response = scraper.get(url, headers=HEADERS, timeout=15)
-        if response.status_code == 200:
-            return BeautifulSoup(response.text, 'html.parser')
-        return None
-    except Exception as e:
-        print(f"      [!] Connection Error: {e}")
-        return None
+def fetch_page(url, extra_headers):
+    return site_client.fetch_page(SESSIONS, url, {**HEADERS, **extra_headers})
+
+def get_html(url):
+    return site_client.get_html(PAGE_CACHE, fetch_page, url)
 
 def download_movie_content(movie_url, year_path):
     """Handles one movie download at a time."""
-    soup = get_soup(movie_url)
-    if not soup: return False
+    resolved = site_client.resolve_download_link(SESSIONS, fetch_page, movie_url, HEADERS)
+    if not resolved:
+        print("      [!] Couldn't load the movie page")
+        return False
 
-    target_link = None
-    file_type = ""
-    
     # Extract clean filename
     base_name = movie_url.split('/')[-1].split('?')[0]
     # Remove any characters that could break the Linux/Windows file system
     movie_name = re.sub(r'[\\/*?:"<>|]', "", base_name).replace("-", "_")
 
-    all_links = soup.find_all('a', href=True)
-    
-    # Priority: ZIP first, then single MP3
-    for a in all_links:
-        if "zip320" in a['href']:
-            target_link = requests.compat.urljoin(movie_url, a['href'])
-            file_type = "zip"
-            break
-            
-    if not target_link:
-        for a in all_links:
-            if "d320" in a['href']:
-                target_link = requests.compat.urljoin(movie_url, a['href'])
-                file_type = "mp3"
-                break
+    # The album zip320 wins over a single d320 song
+    target_link, file_type = resolved
 
     if target_link:
         ext = ".zip" if file_type == "zip" else ".mp3"
         filename = f"{movie_name}_320kbps{ext}"
         save_path = os.path.join(year_path, filename)
         
-        if os.path.exists(save_path):
+        if LIBRARY.has(save_path):
             print(f"      [-] Skipping: {filename}")
             return True
 
         try:
             print(f"      [*] Downloading {filename}...")
-            # stream=True is essential for large music files/zips
-            with scraper.get(target_link, headers=HEADERS, stream=True) as r:
-                r.raise_for_status()
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        if chunk: f.write(chunk)
+            def attempt():
+                rate_limiter.acquire(target_link, "download")
+                # Streams into a .part file and resumes it if an earlier run was cut off
+                with SESSIONS.session() as session:
+                    return downloads.download_file(session, target_link, save_path, HEADERS)
+            retry.call(target_link, attempt)
+            LIBRARY.add(save_path)
             print(f"      [SUCCESS]")
             return True
+        except cancellation.Cancelled:
+            raise
         except Exception as e:
             print(f"      [!] Failed: {e}")
             return False
@@ -87,17 +84,34 @@ def download_movie_content(movie_url, year_path):
 
 # --- MAIN EXECUTION ---
 
-def run_yearly_automated_scrape(mode="test"):
+def run_yearly_automated_scrape(mode="test", sharded=False, new_sweep=False):
+    """sharded=True lets several hosts split the 1952-2026 sweep: years are
+    claimed from the lease queue at WORK_QUEUE_PATH instead of walked in order.
+    Years a finished sweep has done stay done; new_sweep=True queues them again,
+    on the host that starts the next sweep."""
+    site_client.apply_settings(globals())
+    LIBRARY.reset()
     test_dir = os.path.join(ROOT_DOWNLOAD_FOLDER, "test_reports")
-    
+
     if mode == "test":
         os.makedirs(test_dir, exist_ok=True)
         print(f"TEST MODE: Reports saved to {test_dir}")
     else:
         print(f"DOWNLOAD MODE: Files will be saved to {ROOT_DOWNLOAD_FOLDER}")
 
-    for year in YEARS_TO_DOWNLOAD:
-        year_base_url = f"https://www.masstamilan.dev/browse-by-year/{year}"
+    years = ((year, None) for year in YEARS_TO_DOWNLOAD)
+    if sharded:
+        os.makedirs(ROOT_DOWNLOAD_FOLDER, exist_ok=True)
+        queue = work_queue.LeaseQueue(WORK_QUEUE_PATH)
+        # Test listings and downloads are queued apart, so one doesn't count as done for the other
+        kind = f"year:{mode}"
+        if new_sweep:
+            print(f"Requeued {queue.reset(kind)} years finished by the last sweep")
+        print(f"Queued {queue.publish(kind, YEARS_TO_DOWNLOAD)} new years")
+        years = work_queue.claimed(queue, kind)
+
+    for year, lost in years:
+        year_base_url = f"{SITE_URL}/browse-by-year/{year}"
         
         # Folder management based on mode
         if mode == "test":
@@ -113,62 +127,56 @@ def run_yearly_automated_scrape(mode="test"):
         global_seen_urls = set()
         report_entries = []
 
-        while True:
-            page_url = f"{year_base_url}?page={current_page}"
-            soup = get_soup(page_url)
-            
-            # If the page doesn't exist, we've likely hit the end of the year's list
-            if not soup: 
-                print(f"--- Finished scanning pages for {year} ---")
-                break
-
-            # Target the central movie grid only
-            main_grid = soup.find('div', class_='gw') or soup.find('section', class_='bots')
-            if not main_grid: break
-
-            movie_blocks = main_grid.find_all('div', class_='a-i')
+        listing_error = None
+        try:
+            # Downloads stop, and no new movie is started, once a sharded year's lease is lost
+            with cancellation.scope(lost):
+                while True:
+                    page_url = f"{year_base_url}?page={current_page}"
+                    html = get_html(page_url)
             
-            # Use found blocks or fallback to links
-            links_to_process = []
-            if movie_blocks:
-                for block in movie_blocks:
-                    a_tag = block.find('a', href=True)
-                    if a_tag: links_to_process.append(a_tag)
-            else:
-                links_to_process = main_grid.find_all('a', href=True)
-
-            found_new_on_page = False
-            for a in links_to_process:
-                href = a['href']
-                raw_text = a.get_text(separator="\n").strip() 
-                
-                # Filter for song pages and ignore Year/Trending links
-                if "-songs" in href and raw_text and "browse-by-year" not in href:
-                    full_url = requests.compat.urljoin(page_url, href)
-                    
-                    if full_url not in global_seen_urls:
-                        global_seen_urls.add(full_url)
-                        found_new_on_page = True
+                    # If the page doesn't exist, we've likely hit the end of the year's list
+                    if html is None: 
+                        print(f"--- Finished scanning pages for {year} ---")
+                        break
+
+                    # One entry per movie card in the central grid (div.a-i), with the lines under its title
+                    entries, _ = link_extract.extract_listing_entries(html, page_url)
+                    if not entries: break
+
+                    found_new_on_page = False
+                    for full_url, movie_title, details in entries:
+                        if full_url not in global_seen_urls:
+                            global_seen_urls.add(full_url)
+                            found_new_on_page = True
                         
-                        # Data extraction for the report
-                        lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
-                        movie_title = lines[0] if lines else "Unknown Movie"
-                        metadata = " | ".join(lines[1:]) if len(lines) > 1 else ""
-
-                        if mode == "test":
-                            entry = f"MOVIE: {movie_title}\nDETAILS: {metadata}\nURL: {full_url}\n{'-'*40}"
-                            report_entries.append(entry)
-                        else:
-                            # LINEAR DOWNLOAD: The script waits here until download finishes
-                            print(f"  > Processing: {movie_title}")
-                            success = download_movie_content(full_url, current_save_path)
-                            status = "SUCCESS" if success else "FAILED"
-                            entry = f"[{status}] MOVIE: {movie_title}\nURL: {full_url}\n{'-'*40}"
-                            report_entries.append(entry)
-
-            # If no new links found on this page, move to the next year
-            if not found_new_on_page: break
-            current_page += 1
+                            # Data extraction for the report
+                            metadata = " | ".join(details)
+
+                            if mode == "test":
+                                entry = f"MOVIE: {movie_title}\nDETAILS: {metadata}\nURL: {full_url}\n{'-'*40}"
+                                report_entries.append(entry)
+                            else:
+                                # LINEAR DOWNLOAD: The script waits here until download finishes
+                                print(f"  > Processing: {movie_title}")
+                                cancellation.check()
+                                success = download_movie_content(full_url, current_save_path)
+                                status = "SUCCESS" if success else "FAILED"
+                                entry = f"[{status}] MOVIE: {movie_title}\nURL: {full_url}\n{'-'*40}"
+                                report_entries.append(entry)
+
+                    # If no new links found on this page, move to the next year
+                    if not found_new_on_page: break
+                    current_page += 1
+        except cancellation.Cancelled as e:
+            # Another worker owns the year now and writes its report
+            print(f"[!] Stopped {year}: {e}")
+            continue
+        except Exception as e:
+            # A 403 or a server that kept failing isn't the end of the list: say so in the report
+            listing_error = e
+            print(f"ERROR processing year {year}: {e}")
+            if sharded: queue.fail(kind, year, str(e))
 
         # Save report for each year
         report_name = f"verified_list_{year}.txt" if mode == "test" else f"download_report_{year}.txt"
@@ -177,6 +185,8 @@ def run_yearly_automated_scrape(mode="test"):
         with open(final_report_path, "w", encoding="utf-8") as f:
             f.write(f"--- {mode.upper()} REPORT FOR {year} ---\n")
             f.write(f"Total Movies: {len(report_entries)}\n")
+            if listing_error:
+                f.write(f"INCOMPLETE: listing stopped at page {current_page}: {listing_error}\n")
             f.write("="*60 + "\n\n")
             f.write("\n\n".join(report_entries))
         
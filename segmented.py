@@ -0,0 +1,168 @@
+import os
+import json
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+import downloads
+import disk_writer
+import zip_check
+import bandwidth
+import cancellation
+
+# --- CONFIGURATION ---
+SEGMENTS_PER_FILE = 4               # Parallel byte ranges for one file
+MAX_CONNECTIONS = 16                # Segment connections across every download in the process
+MIN_SEGMENTED_SIZE = 8 * 1024 ** 2  # Smaller files aren't worth the extra requests
+MIN_SEGMENT_SIZE = 2 * 1024 ** 2
+SEGMENTS_SUFFIX = ".segments"
+
+_connections = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+class RangeNotSupported(Exception):
+    """The server answered a Range request with the whole file."""
+
+def set_connection_limit(limit):
+    """Changes the global segment connection budget (takes effect for new segments)."""
+    global _connections, MAX_CONNECTIONS
+    MAX_CONNECTIONS = limit
+    _connections = threading.BoundedSemaphore(limit)
+
+# What an unprobed (or failed) probe unpacks to
+UNKNOWN = (None, None, None, False)
+
+# --- HELPER FUNCTIONS ---
+
+def _described(r, size, ranges):
+    return size, r.headers.get("ETag"), r.headers.get("Last-Modified"), ranges
+
+def probe(session, url, headers):
+    """(size, etag, last_modified, ranges) of url: what the server says about the
+    file, with size None when it doesn't give one, and whether it serves byte
+    ranges. None if the probe failed (no answer or an error status), so callers
+    can tell "no ranges" from "ask again later". Uses HEAD; a one-byte Range GET
+    confirms range support when HEAD doesn't advertise it, or stands in for a
+    refused HEAD."""
+    described = None
+    try:
+        r = session.head(url, headers=headers, allow_redirects=True, timeout=15)
+        length = r.headers.get("Content-Length", "")
+        if r.status_code == 200 and length.isdigit():
+            described = _described(r, int(length), False)
+            if r.headers.get("Accept-Ranges", "").lower() == "bytes":
+                return _described(r, int(length), True)
+        with session.get(url, headers={**headers, "Range": "bytes=0-0"}, stream=True, timeout=15) as r:
+            if r.status_code == 206:
+                size = downloads.total_from_content_range(r.headers.get("Content-Range"))
+                return _described(r, size, size is not None)
+            length = r.headers.get("Content-Length", "")
+            if r.status_code == 200 and described is None:
+                # Served whole: no ranges, but the size may still be known
+                described = _described(r, int(length) if length.isdigit() else None, False)
+    except Exception:
+        pass
+    return described
+
+def plan_segments(size, segments):
+    segments = max(1, min(segments, size // MIN_SEGMENT_SIZE))
+    step = -(-size // segments)
+    return [[start, min(start + step, size) - 1, start] for start in range(0, size, step)]
+
+def load_plan(sidecar_path, size, etag):
+    """Saved [start, end, next_byte] segments for this exact file, or None."""
+    try:
+        with open(sidecar_path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if saved.get("size") != size or saved.get("etag") != etag:
+        return None
+    return saved["segments"]
+
+def save_plan(sidecar_path, size, etag, segments):
+    tmp_path = sidecar_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"size": size, "etag": etag, "segments": segments}, f)
+    os.replace(tmp_path, sidecar_path)
+
+# --- DOWNLOAD ---
+
+def download(session, url, save_path, headers, segments=SEGMENTS_PER_FILE, probed=None, hasher=None,
+             pool=None):
+    """Fetches url as parallel byte ranges written in place into a preallocated
+    .part file, then renames it like downloads.download_file does. Progress per
+    segment is kept in a sidecar so an interrupted download resumes each range.
+    Falls back to the single-stream downloader when the server doesn't serve
+    ranges or give a size, the file is small, or a single-stream .part from an
+    earlier attempt is already on disk. probed is what the caller already got
+    from probe(); hasher is fed the finished file. With a
+    session_pool.SessionPool as pool, each segment borrows a session of its own
+    from it; otherwise every segment shares session."""
+    part_path = downloads.part_path_for(save_path)
+    sidecar_path = part_path + SEGMENTS_SUFFIX
+    if segments <= 1 or (os.path.exists(part_path) and not os.path.exists(sidecar_path)):
+        return downloads.download_file(session, url, save_path, headers, hasher=hasher)
+
+    probed = probed or probe(session, url, headers)
+    size, etag, modified, ranges = probed or UNKNOWN
+    if not ranges or not size or size < MIN_SEGMENTED_SIZE:
+        return downloads.download_file(session, url, save_path, headers, hasher=hasher)
+
+    plan = load_plan(sidecar_path, size, etag)
+    if plan is None or not os.path.exists(part_path):
+        plan = plan_segments(size, segments)
+        with open(part_path, "wb") as f:
+            disk_writer.preallocate(f, 0, size)
+        save_plan(sidecar_path, size, etag, plan)
+
+    plan_lock = threading.Lock()
+    # Segment threads count against the caller's bandwidth share and stop when its work is called off
+    flow = bandwidth.current_flow()
+    cancel = cancellation.current()
+    validator = downloads.validator_from({"ETag": etag, "Last-Modified": modified})
+
+    def fetch_segment(segment):
+        start, end, position = segment
+        if position > end:
+            return
+        range_headers = {**headers, "Range": f"bytes={position}-{end}"}
+        # Only accept the range if the file hasn't changed since it was probed
+        if validator: range_headers["If-Range"] = validator
+        def saved(written):
+            with plan_lock:
+                segment[2] = position + written
+                save_plan(sidecar_path, size, etag, plan)
+
+        # Each segment has its own handle, so seek + write never races (and works on Windows)
+        with _connections, bandwidth.flow(flow), cancellation.scope(cancel), \
+                pool.session() if pool else nullcontext(session) as segment_session, \
+                open(part_path, "r+b", buffering=0) as f:
+            f.seek(position)
+            with segment_session.get(url, headers=range_headers, stream=True, timeout=30) as r:
+                if r.status_code == 200:
+                    raise RangeNotSupported(url)
+                r.raise_for_status()
+                # Unbuffered writes of disk_writer.WRITE_SIZE: progress is saved as each lands
+                position += disk_writer.copy_response(r, f, limit=end + 1 - position, progress=saved)
+        if position <= end:
+            raise downloads.IncompleteDownload(f"segment {start}-{end} stopped at {position}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+            for future in [executor.submit(fetch_segment, segment) for segment in plan]:
+                future.result()
+    except RangeNotSupported:
+        os.remove(part_path)
+        os.remove(sidecar_path)
+        return downloads.download_file(session, url, save_path, headers, hasher=hasher)
+
+    with open(part_path, "r+b") as f:
+        disk_writer.finish(f)
+    # Segments land out of order, so the zip check and hash run in one sequential pass at the end
+    try:
+        downloads.finish_zip_check(downloads.start_checks(save_path, part_path, size, hasher), part_path, size)
+    except zip_check.CorruptZip:
+        os.remove(sidecar_path)
+        raise
+    downloads.promote(part_path, save_path)
+    os.remove(sidecar_path)
+    return size
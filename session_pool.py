@@ -0,0 +1,72 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+POOL_CONNECTIONS = 4   # Hosts each session keeps a connection pool for (site, download CDN, ...)
+POOL_MAXSIZE = 8       # Kept-alive connections per host per session; segmented downloads use several
+
+# --- POOL ---
+
+class SessionPool:
+    """Hands each worker a session of its own instead of one session shared by
+    every thread. Sessions are borrowed for the length of a request (or of a
+    streamed download) and given back, most recently used first, so their
+    kept-alive connections are reused rather than reopened.
+
+    factory() makes a new session, e.g. cloudscraper.create_scraper."""
+
+    def __init__(self, factory, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        self.factory = factory
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle = queue.LifoQueue()
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    def _create(self):
+        session = self.factory()
+        for adapter in session.adapters.values():
+            # Rebuilding the pool manager keeps adapter specifics such as cloudscraper's TLS context
+            adapter.init_poolmanager(self.pool_connections, self.pool_maxsize, block=False)
+        with self.lock:
+            self.sessions.append(session)
+        return session
+
+    @contextmanager
+    def session(self):
+        try:
+            session = self.idle.get_nowait()
+        except queue.Empty:
+            session = self._create()
+        try:
+            yield session
+        finally:
+            self.idle.put(session)
+
+    def get(self, url, **kwargs):
+        """session.get on a borrowed session, for requests that are read in full."""
+        with self.session() as session:
+            return session.get(url, **kwargs)
+
+    def stats(self):
+        """{"sessions", "requests", "connections", "reused"} across every session so far."""
+        with self.lock:
+            sessions = list(self.sessions)
+        requests = connections = 0
+        for session in sessions:
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None: continue
+                    requests += pool.num_requests
+                    connections += pool.num_connections
+        return {"sessions": len(sessions), "requests": requests, "connections": connections,
+                "reused": max(0, requests - connections)}
+
+    def report(self):
+        stats = self.stats()
+        share = stats["reused"] / stats["requests"] * 100 if stats["requests"] else 0
+        print(f"[*] HTTP: {stats['requests']} requests over {stats['connections']} connections "
+              f"in {stats['sessions']} sessions ({share:.0f}% reused)")
@@ -0,0 +1,114 @@
+import time
+from contextlib import nullcontext
+import cloudscraper
+import bandwidth
+import clearance
+import link_extract
+import rate_limiter
+import retry
+import segmented
+import upstream_check
+
+# --- CONFIGURATION ---
+PAGE_TIMEOUT = 15
+STREAM_CHUNK_SIZE = 16 * 1024  # Movie pages are scanned this much at a time
+
+# Budget name -> (rate setting, burst setting) in the scripts' configuration
+BUDGET_SETTINGS = {
+    "page": ("PAGE_REQUESTS_PER_SEC", "PAGE_BURST"),
+    "download": ("DOWNLOADS_PER_SEC", "DOWNLOAD_BURST"),
+    "probe": ("PROBES_PER_SEC", "PROBE_BURST"),
+}
+
+# --- SETTINGS ---
+
+def apply_settings(settings):
+    """Pushes a script's settings (its globals()) into the shared modules; called
+    when a run starts, so settings changed after import still count. Settings a
+    script doesn't have are left at the shared modules' defaults."""
+    for budget, (rate, burst) in BUDGET_SETTINGS.items():
+        if rate in settings:
+            rate_limiter.set_budget(budget, settings[rate], settings[burst])
+    if "MAX_SEGMENT_CONNECTIONS" in settings:
+        segmented.set_connection_limit(settings["MAX_SEGMENT_CONNECTIONS"])
+    if "PARSE_PROCESSES" in settings:
+        link_extract.set_parse_processes(settings["PARSE_PROCESSES"])
+    if "MAX_DOWNLOAD_BYTES_PER_SEC" in settings:
+        bandwidth.set_rate(settings["MAX_DOWNLOAD_BYTES_PER_SEC"])
+        bandwidth.set_schedule(settings.get("BANDWIDTH_SCHEDULE", []))
+        for year, weight in settings.get("YEAR_WEIGHTS", {}).items():
+            bandwidth.set_weight(year, weight)
+
+# --- SESSIONS ---
+
+def new_session(site_url, headers):
+    """A cloudscraper session for site_url, for a SessionPool factory. The scripts
+    keep a pool of these, so every worker borrows a session of its own and they
+    share nothing but the factory."""
+    session = cloudscraper.create_scraper()
+    # Clearance cookies are solved once and shared with every worker and later runs
+    clearance.prepare(session, site_url, headers)
+    return session
+
+# --- PAGES ---
+
+def fetch_page(sessions, url, headers, limit=None):
+    """GET of a site page on a session borrowed from sessions, paced by the page
+    budget. With limit (a concurrency.AdaptiveLimit) the request also takes one of
+    its slots and reports how long it took."""
+    def attempt():
+        with limit.slot(url) if limit else nullcontext():
+            rate_limiter.acquire(url)
+            started = time.monotonic()
+            response = sessions.get(url, headers=headers, timeout=PAGE_TIMEOUT)
+            if limit: limit.record_latency(time.monotonic() - started)
+            return response
+    # 429/5xx/timeouts are retried with backoff; a 404 comes straight back as the end of a listing
+    return retry.call(url, attempt)
+
+def get_html(page_cache, fetch_page, url):
+    """Page HTML, or None when the page doesn't exist (404). Anything else that stops
+    the page from being read raises, so a listing walk can't mistake it for its end.
+    fetch_page(url, extra_headers) is the script's fetch_page."""
+    # Served from the on-disk cache when fresh, revalidated with a conditional GET when stale
+    return page_cache.get_text(url, fetch_page)
+
+# --- MOVIE PAGES ---
+
+def resolve_download_link(sessions, fetch_page, movie_url, headers):
+    """(link, "zip"|"mp3") for a movie page, or None if the page can't be fetched.
+    The page is streamed on a session borrowed from sessions and the connection
+    dropped as soon as the zip320 anchor has gone past, so movie pages never go
+    through the page cache. With parser processes the page is fetched whole with
+    fetch_page(url, extra_headers) and parsed in one of them instead."""
+    try:
+        if link_extract.parses_in_processes():
+            r = fetch_page(movie_url, {})
+            if r.status_code != 200:
+                return None
+            html = link_extract.decode_page(r.content, r.headers.get("Content-Type"))
+            return link_extract.parse_download_link(html, movie_url)
+        # The session stays borrowed until the streamed page is closed
+        with sessions.session() as session:
+            def attempt():
+                rate_limiter.acquire(movie_url)
+                return session.get(movie_url, headers=headers, timeout=PAGE_TIMEOUT, stream=True)
+            with retry.call(movie_url, attempt) as r:
+                if r.status_code != 200:
+                    return None
+                encoding = link_extract.declared_encoding(r.headers.get("Content-Type"))
+                return link_extract.scan_download_link(r.iter_content(chunk_size=STREAM_CHUNK_SIZE), movie_url, encoding)
+    except Exception:
+        return None
+
+# --- EXISTING FILES ---
+
+def verify_existing(sessions, library, state, target_link, save_path, headers):
+    """False when the file on disk doesn't match upstream and was set up to be
+    fetched again; it is then dropped from library so the skip check misses it."""
+    rate_limiter.acquire(target_link, "probe")
+    with sessions.session() as session:
+        verified = upstream_check.verify(state, session, target_link, save_path, headers)
+    if not verified:
+        library.discard(save_path)
+    return verified
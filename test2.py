@@ -3,7 +3,7 @@ import time
 import cloudscraper
 import requests
 import re
-import zipfile  # New library to handle the zip repair
+import zip_check  # Streaming zip check and repair
 from bs4 import BeautifulSoup
 
 # --- CONFIGURATION ---
@@ -22,18 +22,11 @@ def sanitize_filename(name):
 
 def repair_zip(file_path):
     """Attempt to fix common zip header issues so Windows can open it."""
-    temp_path = file_path + ".tmp"
     try:
-        with zipfile.ZipFile(file_path, 'r') as z_in:
-            with zipfile.ZipFile(temp_path, 'w') as z_out:
-                for item in z_in.infolist():
-                    z_out.writestr(item, z_in.read(item.filename))
-        os.remove(file_path)
-        os.rename(temp_path, file_path)
+        # Member data is copied as is, still compressed, instead of read into memory
+        zip_check.repair(file_path)
         print(f"      [FIXED] Zip header repaired for Windows compatibility.")
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         print(f"      [WARNING] Could not repair zip: {e}")
 
 def download_movie_content(url):
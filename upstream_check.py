@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import downloads
+import segmented
+
+# --- CONFIGURATION ---
+AUDIT_WORKERS = 8  # Files of a year checked at once; each check is a rate-limited HEAD
+
+# --- HELPER FUNCTIONS ---
+
+def remote_validators(session, url, headers, timeout=15):
+    """(size, etag, last_modified) of url from a HEAD, falling back to a one-byte
+    Range GET for hosts that refuse HEAD; None when neither gives a size."""
+    try:
+        r = session.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+        length = r.headers.get("Content-Length", "")
+        if r.status_code == 200 and length.isdigit():
+            return int(length), r.headers.get("ETag"), r.headers.get("Last-Modified")
+        with session.get(url, headers={**headers, "Range": "bytes=0-0"}, stream=True, timeout=timeout) as r:
+            if r.status_code == 206:
+                size = downloads.total_from_content_range(r.headers.get("Content-Range"))
+                if size is not None:
+                    return size, r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except Exception:
+        pass
+    return None
+
+def changed_upstream(stored, remote):
+    """True when the stored and remote validators prove different content."""
+    if stored is None:
+        return False
+    _, stored_etag, stored_modified = stored
+    _, etag, modified = remote
+    if stored_etag and etag:
+        return stored_etag != etag
+    if stored_modified and modified:
+        return stored_modified != modified
+    return False
+
+def unchanged_upstream(stored, remote):
+    """True only when the stored validators prove the remote file is the same
+    content: an equal strong ETag, or else an equal Last-Modified. Without them
+    nothing is proven, e.g. for a file that predates the index."""
+    if stored is None:
+        return False
+    _, stored_etag, stored_modified = stored
+    _, etag, modified = remote
+    if stored_etag and etag and not etag.startswith("W/"):
+        return stored_etag == etag
+    if stored_modified and modified:
+        return stored_modified == modified
+    return False
+
+# --- VERIFICATION ---
+
+def verify(state, session, url, save_path, headers):
+    """Checks a file already on disk against a HEAD of its link instead of
+    trusting its name. Returns True when it matches (size, and the ETag or
+    Last-Modified stored for it when there is one). Otherwise the file is made
+    ready for the normal download to fix it and False is returned: a truncated
+    copy of content the stored validators prove unchanged becomes the .part file,
+    with its validator for If-Range, so the download resumes after it; anything
+    else is removed and fetched again.
+
+    When the upstream can't be reached the file is given the benefit of the doubt."""
+    filename = os.path.basename(save_path)
+    remote = remote_validators(session, url, headers)
+    if remote is None:
+        print(f"      [!] Couldn't check {filename} upstream, keeping it")
+        return True
+    size = remote[0]
+    stored = state.validators(save_path) if state else None
+    local_size = os.path.getsize(save_path)
+
+    if local_size == size and not changed_upstream(stored, remote):
+        # First check of a file that predates the index: its validators are trusted from now on
+        if state: state.record_validators(save_path, *remote)
+        return True
+
+    part_path = downloads.part_path_for(save_path)
+    # Progress of a segmented attempt belongs to the .part file that is about to go
+    sidecar_path = part_path + segmented.SEGMENTS_SUFFIX
+    if os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+    # A hardlinked copy (see dedup) shares its bytes with other names; appending would change them too
+    resumable = 0 < local_size < size and unchanged_upstream(stored, remote) \
+        and os.stat(save_path).st_nlink == 1 and downloads.resume_offset(part_path) <= local_size
+    if resumable:
+        print(f"      [!] {filename} is truncated ({local_size} of {size} bytes), resuming")
+        os.replace(save_path, part_path)
+        # The resume is sent with If-Range, so a change upstream since the check still restarts it
+        _, etag, modified = remote
+        downloads.save_validator(part_path, downloads.validator_from({"ETag": etag, "Last-Modified": modified}))
+    else:
+        print(f"      [!] {filename} doesn't match upstream ({local_size} of {size} bytes), fetching again")
+        os.remove(save_path)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        downloads.save_validator(part_path, None)
+    if state:
+        state.forget_file(save_path)
+        state.record_validators(save_path, *remote)
+    return False
+
+def audit_year(state, year, verify, exists=os.path.exists, workers=AUDIT_WORKERS):
+    """Re-checks the files of a year's completed movies; verify(link, save_path)
+    is verify() bound to the caller's session and rate limits, exists(save_path)
+    may answer from an index instead of the disk. Checks run on `workers` threads,
+    so the year's discovery isn't held up for one HEAD after another. Movies whose
+    file is gone or doesn't match go back to pending, so the run that follows
+    resumes or re-fetches just those. Returns how many were sent back."""
+    completed = state.completed_files(year)
+
+    def audit(entry):
+        movie_url, link, save_path = entry
+        try:
+            if not exists(save_path):
+                error = "missing on disk"
+            elif not verify(link, save_path):
+                error = "doesn't match upstream"
+            else:
+                return False
+        except Exception as e:
+            # A file that can't even be checked (gone mid-check, share error) is fetched again too
+            print(f"      [!] Couldn't audit {os.path.basename(save_path)}: {e}")
+            error = f"check failed: {e}"
+        state.record_result(movie_url, "FAILED", error=f"audit: {error}")
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        redo = sum(executor.map(audit, completed))
+    print(f"    [*] {year}: audited {len(completed)} files, {redo} to fetch again")
+    return redo
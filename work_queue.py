@@ -0,0 +1,234 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cancellation
+
+# --- CONFIGURATION ---
+LEASE_SECONDS = 300      # A worker that stops heartbeating loses its item after this long
+HEARTBEAT_EVERY = 60
+MAX_ATTEMPTS = 3         # Claims per item before it is parked as FAILED
+IDLE_POLL = 30           # How often an idle worker looks for leases that expired elsewhere
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work (
+    kind        TEXT,
+    key         TEXT,
+    status      TEXT NOT NULL DEFAULT 'QUEUED',
+    owner       TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated_at  REAL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS work_claim ON work (kind, status, lease_until);
+"""
+
+# --- QUEUE ---
+
+class LeaseQueue:
+    """Work items shared by several processes or machines through one SQLite file,
+    normally on the same shared volume as the downloads.
+
+    A worker claims an item with a time-limited lease and keeps it alive with
+    heartbeats while it works; an item whose lease runs out (the worker crashed
+    or lost the share) goes back to whoever claims next. Items are (kind, key)
+    pairs, e.g. ("year:prod", "1987")."""
+
+    def __init__(self, path, worker_id=None, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        # WAL needs shared memory between processes, which SMB/NFS shares can't give;
+        # the rollback journal only relies on file locks
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+        self.held = {}
+        self.heartbeat_thread = None
+
+    def _write(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def _read(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # --- Coordinator side ---
+
+    def publish(self, kind, keys):
+        """Queues keys that aren't in the queue yet; returns how many were new."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = sum(self.conn.execute(
+                    "INSERT OR IGNORE INTO work (kind, key, updated_at) VALUES (?, ?, ?)",
+                    (kind, key, now)).rowcount for key in keys)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def reset(self, kind, statuses=("DONE", "FAILED")):
+        """Queues finished items again, e.g. before a fresh full sweep."""
+        marks = ",".join("?" * len(statuses))
+        return self._write(
+            f"UPDATE work SET status = 'QUEUED', owner = NULL, attempts = 0, error = NULL, updated_at = ? "
+            f"WHERE kind = ? AND status IN ({marks})", (time.time(), kind, *statuses))
+
+    def counts(self, kind):
+        return dict(self._read("SELECT status, COUNT(*) FROM work WHERE kind = ? GROUP BY status", (kind,)))
+
+    def outstanding(self, kind):
+        """Items still queued or leased, by anyone."""
+        return self._read("SELECT COUNT(*) FROM work WHERE kind = ? AND status IN ('QUEUED', 'LEASED')",
+                          (kind,))[0][0]
+
+    # --- Worker side ---
+
+    def claim(self, kind):
+        """Leases the next queued (or expired) item to this worker; returns its key or None."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT key, status, owner FROM work WHERE kind = ? AND "
+                    "(status = 'QUEUED' OR (status = 'LEASED' AND lease_until < ?)) "
+                    "ORDER BY status = 'LEASED', attempts, rowid LIMIT 1", (kind, now)).fetchone()
+                if row:
+                    self.conn.execute(
+                        "UPDATE work SET status = 'LEASED', owner = ?, lease_until = ?, attempts = attempts + 1, "
+                        "updated_at = ? WHERE kind = ? AND key = ?",
+                        (self.worker_id, now + self.lease_seconds, now, kind, row[0]))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row and row[1] == "LEASED":
+            print(f"    [-] {kind} {row[0]}: lease held by {row[2]} expired, taking it over")
+        return row[0] if row else None
+
+    def heartbeat(self, kind, key):
+        """Extends this worker's lease; False if it was lost to another worker."""
+        return self._write(
+            "UPDATE work SET lease_until = ?, updated_at = ? WHERE kind = ? AND key = ? "
+            "AND owner = ? AND status = 'LEASED'",
+            (time.time() + self.lease_seconds, time.time(), kind, key, self.worker_id)) > 0
+
+    def complete(self, kind, key):
+        """Marks the item done; False if this worker no longer holds a live lease on it."""
+        now = time.time()
+        return self._write(
+            "UPDATE work SET status = 'DONE', lease_until = NULL, error = NULL, updated_at = ? "
+            "WHERE kind = ? AND key = ? AND owner = ? AND status = 'LEASED' AND lease_until >= ?",
+            (now, kind, key, self.worker_id, now)) > 0
+
+    def fail(self, kind, key, error):
+        """Gives the item back for another try, or parks it once MAX_ATTEMPTS is used up."""
+        return self._write(
+            "UPDATE work SET status = CASE WHEN attempts >= ? THEN 'FAILED' ELSE 'QUEUED' END, "
+            "owner = NULL, lease_until = NULL, error = ?, updated_at = ? "
+            "WHERE kind = ? AND key = ? AND owner = ? AND status = 'LEASED'",
+            (MAX_ATTEMPTS, error, time.time(), kind, key, self.worker_id)) > 0
+
+    # --- Heartbeats ---
+
+    def hold(self, kind, key):
+        """Keeps the lease on a claimed item alive from a background thread. Returns
+        an Event that is set once the lease is lost: another worker took the item
+        over, or heartbeats kept failing until the lease was about to run out."""
+        lost = threading.Event()
+        with self.lock:
+            self.held[(kind, key)] = (lost, time.monotonic())
+            if self.heartbeat_thread is None:
+                self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+                self.heartbeat_thread.start()
+        return lost
+
+    def drop(self, kind, key):
+        with self.lock:
+            self.held.pop((kind, key), None)
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_EVERY)
+            with self.lock:
+                held = list(self.held.items())
+            for (kind, key), (lost, renewed) in held:
+                try:
+                    if self.heartbeat(kind, key):
+                        with self.lock:
+                            if (kind, key) in self.held:
+                                self.held[(kind, key)] = (lost, time.monotonic())
+                        continue
+                    print(f"    [!] Lost the lease on {kind} {key} to another worker, stopping work on it")
+                except sqlite3.Error as e:
+                    print(f"    [!] Heartbeat for {kind} {key} failed: {e}")
+                    # Stop before the lease can run out, not after someone else has taken it
+                    if time.monotonic() - renewed < self.lease_seconds - HEARTBEAT_EVERY:
+                        continue
+                    print(f"    [!] Lease on {kind} {key} is about to expire, stopping work on it")
+                lost.set()
+                self.drop(kind, key)
+
+# --- WORKER LOOPS ---
+
+def claimed(queue, kind):
+    """Yields (key, lost) for items claimed from the queue, for a plain for loop.
+    The lease is kept alive while the loop body runs and the item is marked done
+    when the next one is asked for; lost is the Event from hold(), for the body to
+    run its work in cancellation.scope(lost) so it stops once the lease is gone.
+    Only a body that ran to its end completes the item: one that raised, broke
+    out of the loop or lost the lease leaves it for the next claimer.
+    Ends once nothing is queued or leased anywhere; while other workers still hold
+    leases it waits, in case one of them expires."""
+    while True:
+        key = queue.claim(kind)
+        if key is None:
+            if not queue.outstanding(kind):
+                return
+            time.sleep(IDLE_POLL)
+            continue
+        lost = queue.hold(kind, key)
+        try:
+            yield key, lost
+        finally:
+            queue.drop(kind, key)
+        # Work stopped by a lost lease is unfinished, even if the body caught Cancelled
+        if lost.is_set():
+            continue
+        # No-op if the body already called queue.fail()
+        queue.complete(kind, key)
+
+def run_workers(queue, kind, handler, workers=1):
+    """Runs handler(key) for claimed items on `workers` threads until the queue is
+    drained. An exception hands the item back with queue.fail(). The handler runs
+    in a cancellation scope, so cancellation.check() and the downloads in it stop
+    once the item's lease is lost."""
+    def work():
+        for key, lost in claimed(queue, kind):
+            try:
+                with cancellation.scope(lost):
+                    handler(key)
+            except cancellation.Cancelled:
+                # The lease is gone or about to run out; whoever claims the item next finishes it
+                print(f"    [!] Stopped {kind} {key}: lease lost")
+            except Exception as e:
+                print(f"ERROR processing {kind} {key}: {e}")
+                queue.fail(kind, key, str(e))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(work) for _ in range(workers)]:
+            future.result()
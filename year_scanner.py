@@ -0,0 +1,59 @@
+import link_extract
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURATION ---
+LISTING_WORKERS = 4  # Listing pages fetched at once for one year
+
+# --- SCANNER ---
+
+def iter_year_pages(year_base_url, get_html, max_workers=LISTING_WORKERS):
+    """Yields (page_number, links) for a year's listing in page order.
+
+    Page 1 is fetched first to read the page count; the remaining pages are then
+    fetched concurrently. If the count isn't advertised, pages are probed in
+    windows of max_workers until one comes back empty. Stops at the first
+    missing or empty page. With max_workers=1 this is the plain sequential walk,
+    which is what callers that may stop early (incremental sync) should use.
+
+    get_html(url) returns None only for a page that doesn't exist (404) and
+    raises for any other failure, which ends the walk with that exception: only
+    a walk that runs to completion has seen the whole year.
+
+    get_html is called from worker threads, so it must be thread-safe. Parsing
+    happens in those threads too, through link_extract's fast backends, or in
+    its parser processes when link_extract.PARSE_PROCESSES is set."""
+    def fetch_links(page):
+        page_url = f"{year_base_url}?page={page}"
+        html = get_html(page_url)
+        # A 404 past the last page; an empty grid is handled by the caller the same way
+        if html is None: return None, None
+        return link_extract.parse_listing(html, page_url)
+
+    links, last_page = fetch_links(1)
+    if not links: return
+    yield 1, links
+
+    if max_workers <= 1:
+        page = 2
+        while True:
+            links, _ = fetch_links(page)
+            if not links: return
+            yield page, links
+            page += 1
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        next_page = 2
+        while last_page is None or next_page <= last_page:
+            window_end = last_page + 1 if last_page else next_page + max_workers
+            futures = [(page, executor.submit(fetch_links, page)) for page in range(next_page, window_end)]
+            for page, future in futures:
+                links, seen_last_page = future.result()
+                if not links: return
+                yield page, links
+                # Pagination bars that only show nearby pages reveal more as we go
+                if last_page and seen_last_page and seen_last_page > last_page:
+                    last_page = seen_last_page
+            next_page = window_end
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,315 @@
+import os
+import struct
+import zlib
+import zipfile
+import disk_writer
+
+# --- CONFIGURATION ---
+VERIFY_ZIPS = True            # Check album zips while they download
+INFLATE_STEP = 1024 * 1024    # Max decompressed bytes held at once while checking deflated members
+COPY_SIZE = 8 * 1024 * 1024
+
+LOCAL = b"PK\x03\x04"
+CENTRAL = b"PK\x01\x02"
+END = b"PK\x05\x06"
+END64 = b"PK\x06\x06"
+LOCATOR64 = b"PK\x06\x07"
+DESCRIPTOR = b"PK\x07\x08"
+
+LOCAL_FIXED = struct.Struct("<4sHHHHHIIIHH")
+CENTRAL_FIXED = struct.Struct("<4sHHHHHHIIIHHHHHII")
+END_FIXED = struct.Struct("<4sHHHHIIH")
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+class CorruptZip(ValueError):
+    """The archive's bytes contradict its own headers (bad CRC, size or structure)."""
+
+class TruncatedZip(CorruptZip):
+    """The archive stops before its end-of-central-directory record."""
+
+# --- STREAMING VERIFIER ---
+
+class ZipStreamVerifier:
+    """Checks a zip as its bytes arrive, in order, without holding members in memory.
+
+    Each member's CRC32 (and size) is checked as soon as its data has streamed
+    through, so corruption is reported mid-download; the central directory is
+    counted against the members seen, and finish() reports a truncated archive.
+    Archives the stream can't follow (stored members with a data descriptor,
+    unknown methods with one) are left unchecked rather than rejected."""
+
+    def __init__(self, name=""):
+        self.name = name
+        self.offset = 0
+        self.pending = bytearray()
+        self.need = 4
+        self.step = self._signature
+        self.member = None
+        self.members = 0
+        self.central_entries = 0
+        self.done = False
+        self.verifying = True
+
+    def feed(self, data):
+        if not self.verifying or self.done:
+            return
+        view = memoryview(data).cast("B")
+        while view and self.verifying and not self.done:
+            if self.step is None:
+                view = self._member_data(view)
+                continue
+            take = min(self.need - len(self.pending), len(view))
+            self.pending += view[:take]
+            view = view[take:]
+            self.offset += take
+            # A handler may find it already has every byte it asked for (empty names, comments)
+            while self.step is not None and len(self.pending) == self.need and self.verifying and not self.done:
+                self.step(bytes(self.pending))
+
+    def finish(self):
+        """Raises TruncatedZip unless the whole archive, up to its end record, went through."""
+        if self.verifying and not self.done:
+            where = f"member {self.member['name']}" if self.member else "the headers"
+            raise TruncatedZip(f"{self.name}: archive ends at byte {self.offset} inside {where}")
+        return self.members
+
+    # --- records ---
+
+    def _next_record(self):
+        self.pending.clear()
+        self.need = 4
+        self.step = self._signature
+
+    def _signature(self, header):
+        signature = header[:4]
+        if signature == LOCAL:
+            self.need, self.step = LOCAL_FIXED.size, self._local_fixed
+        elif signature == CENTRAL:
+            self.need, self.step = CENTRAL_FIXED.size, self._central_fixed
+        elif signature == END:
+            self.need, self.step = END_FIXED.size, self._end_fixed
+        elif signature == END64:
+            self.need, self.step = 12, self._end64_fixed
+        elif signature == LOCATOR64:
+            self.need, self.step = 20, lambda header: self._next_record()
+        else:
+            raise CorruptZip(f"{self.name}: unexpected bytes {signature!r} at offset {self.offset - 4}")
+
+    def _local_fixed(self, header):
+        name_len, extra_len = struct.unpack_from("<HH", header, 26)
+        self.need, self.step = LOCAL_FIXED.size + name_len + extra_len, self._local_full
+
+    def _local_full(self, header):
+        _, _, flags, method, _, _, crc, csize, usize, name_len, extra_len = LOCAL_FIXED.unpack_from(header)
+        name = header[30:30 + name_len].decode("utf-8" if flags & FLAG_UTF8 else "cp437", "replace")
+        zip64 = csize == 0xFFFFFFFF or usize == 0xFFFFFFFF
+        if zip64:
+            usize, csize = zip64_sizes(header[30 + name_len:30 + name_len + extra_len], usize, csize)
+        descriptor = bool(flags & FLAG_DESCRIPTOR)
+        checked = not flags & FLAG_ENCRYPTED and method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+        if descriptor and (method != zipfile.ZIP_DEFLATED or not checked):
+            # Nothing marks where this member's data ends, so the rest can't be followed
+            self.verifying = False
+            return
+        self.member = {
+            "name": name, "method": method, "crc": crc, "size": usize, "checked": checked,
+            "descriptor": descriptor, "zip64": zip64, "remaining": None if descriptor else csize,
+            "running_crc": 0, "written": 0,
+            "inflater": zlib.decompressobj(-15) if checked and method == zipfile.ZIP_DEFLATED else None,
+        }
+        self.pending.clear()
+        self.step = None
+        if self.member["remaining"] == 0:
+            self._end_member_data()
+
+    def _member_data(self, view):
+        member = self.member
+        take = len(view) if member["remaining"] is None else min(len(view), member["remaining"])
+        data, rest = view[:take], view[take:]
+        if member["inflater"] is not None:
+            unused = self._inflate(data)
+            # A deflate stream knows where it ends; hand back what belongs to the next record
+            if unused:
+                data, rest = data[:len(data) - unused], view[take - unused:]
+        elif member["checked"]:
+            member["running_crc"] = zlib.crc32(data, member["running_crc"])
+            member["written"] += len(data)
+        self.offset += len(data)
+        if member["remaining"] is not None:
+            member["remaining"] -= len(data)
+        if member["remaining"] == 0 or (member["inflater"] is not None and member["inflater"].eof):
+            self._end_member_data()
+        return rest
+
+    def _inflate(self, data):
+        member = self.member
+        inflater = member["inflater"]
+        try:
+            out = inflater.decompress(data, INFLATE_STEP)
+            while True:
+                member["running_crc"] = zlib.crc32(out, member["running_crc"])
+                member["written"] += len(out)
+                if inflater.eof or not inflater.unconsumed_tail:
+                    break
+                out = inflater.decompress(inflater.unconsumed_tail, INFLATE_STEP)
+        except zlib.error as e:
+            raise CorruptZip(f"{self.name}: bad deflate data in {member['name']}: {e}") from None
+        return len(inflater.unused_data)
+
+    def _end_member_data(self):
+        if self.member["descriptor"]:
+            self.need, self.step = 4, self._descriptor_start
+        else:
+            self._check_member(self.member["crc"], self.member["size"])
+
+    def _descriptor_start(self, header):
+        # The descriptor's own signature is optional
+        size = 8 if self.member["zip64"] else 4
+        self.need = (4 if header[:4] == DESCRIPTOR else 0) + 4 + 2 * size
+        self.step = self._descriptor
+
+    def _descriptor(self, header):
+        body = header[4:] if header[:4] == DESCRIPTOR else header
+        if self.member["zip64"]:
+            crc, _, usize = struct.unpack_from("<IQQ", body)
+        else:
+            crc, _, usize = struct.unpack_from("<III", body)
+        self._check_member(crc, usize)
+
+    def _check_member(self, crc, size):
+        member = self.member
+        if member["checked"]:
+            if member["running_crc"] != crc:
+                raise CorruptZip(f"{self.name}: CRC mismatch in {member['name']}")
+            if member["written"] != size:
+                raise CorruptZip(f"{self.name}: {member['name']} is {member['written']} bytes, header says {size}")
+        self.members += 1
+        self.member = None
+        self._next_record()
+
+    def _central_fixed(self, header):
+        name_len, extra_len, comment_len = struct.unpack_from("<HHH", header, 28)
+        self.need = CENTRAL_FIXED.size + name_len + extra_len + comment_len
+        self.step = self._central_full
+
+    def _central_full(self, header):
+        self.central_entries += 1
+        self._next_record()
+
+    def _end64_fixed(self, header):
+        self.need = 12 + struct.unpack_from("<Q", header, 4)[0]
+        self.step = lambda header: self._next_record()
+
+    def _end_fixed(self, header):
+        self.need = END_FIXED.size + struct.unpack_from("<H", header, 20)[0]
+        self.step = self._end_full
+
+    def _end_full(self, header):
+        total = END_FIXED.unpack_from(header)[4]
+        if self.central_entries != self.members or (total != 0xFFFF and total != self.central_entries):
+            raise CorruptZip(f"{self.name}: central directory lists {self.central_entries} of "
+                             f"{self.members} members (end record says {total})")
+        self.done = True
+
+# --- HELPER FUNCTIONS ---
+
+def zip64_sizes(extra, usize, csize):
+    """Real sizes from a local header's zip64 extra field (only the saturated ones are present)."""
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from("<HH", extra, pos)
+        if tag == 0x0001:
+            values = iter(struct.unpack_from(f"<{length // 8}Q", extra, pos + 4))
+            if usize == 0xFFFFFFFF: usize = next(values, usize)
+            if csize == 0xFFFFFFFF: csize = next(values, csize)
+            break
+        pos += 4 + length
+    return usize, csize
+
+def wants_check(save_path):
+    return VERIFY_ZIPS and save_path.lower().endswith(".zip")
+
+def verify_file(path):
+    """Checks a finished zip in one sequential pass. Returns the member count, raises CorruptZip."""
+    verifier = ZipStreamVerifier(os.path.basename(path))
+    disk_writer.replay(path, verifier.feed)
+    return verifier.finish()
+
+# --- REPAIR ---
+
+def copy_range(src, dst, offset, length):
+    """Copies length bytes from src at offset to dst's current position, in the kernel
+    when the platform allows it (copy_file_range), otherwise through one reused buffer."""
+    if hasattr(os, "copy_file_range"):
+        try:
+            while length:
+                count = os.copy_file_range(src.fileno(), dst.fileno(), length, offset)
+                if not count:
+                    raise CorruptZip(f"member data ends early at byte {offset}")
+                offset += count
+                length -= count
+            return
+        except OSError:
+            # Different filesystems, or not supported here: finish with plain reads
+            pass
+    buffer = memoryview(bytearray(min(COPY_SIZE, max(length, 1))))
+    src.seek(offset)
+    while length:
+        count = src.readinto(buffer[:min(len(buffer), length)])
+        if not count:
+            raise CorruptZip(f"member data ends early at byte {offset}")
+        disk_writer.write_all(dst, buffer[:count])
+        offset += count
+        length -= count
+
+def dos_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def repair(path):
+    """Rewrites every local header from the central directory and drops data
+    descriptors, which is what trips up Windows' built-in zip support. Member data
+    is copied as is, still compressed, so memory use doesn't depend on track size.
+    The rewritten archive is verified before it replaces the original."""
+    tmp_path = path + ".tmp"
+    try:
+        with zipfile.ZipFile(path) as z, open(path, "rb", buffering=0) as src, \
+                open(tmp_path, "wb", buffering=0) as dst:
+            central = bytearray()
+            count = 0
+            for info in z.infolist():
+                if max(info.file_size, info.compress_size, info.header_offset, dst.tell()) >= 0xFFFFFFFF:
+                    raise CorruptZip("zip64 archives are left as they are")
+                src.seek(info.header_offset)
+                fixed = src.read(LOCAL_FIXED.size)
+                if fixed[:4] != LOCAL:
+                    raise CorruptZip(f"no local header for {info.filename}")
+                name_len, extra_len = struct.unpack_from("<HH", fixed, 26)
+                data_start = info.header_offset + LOCAL_FIXED.size + name_len + extra_len
+
+                try:
+                    name, flags = info.filename.encode("ascii"), info.flag_bits & ~(FLAG_DESCRIPTOR | FLAG_UTF8)
+                except UnicodeEncodeError:
+                    name, flags = info.filename.encode("utf-8"), (info.flag_bits & ~FLAG_DESCRIPTOR) | FLAG_UTF8
+                mtime, mdate = dos_time(info.date_time)
+                local_offset = dst.tell()
+                disk_writer.write_all(dst, LOCAL_FIXED.pack(LOCAL, 20, flags, info.compress_type, mtime, mdate, info.CRC,
+                                           info.compress_size, info.file_size, len(name), 0) + name)
+                copy_range(src, dst, data_start, info.compress_size)
+                central += CENTRAL_FIXED.pack(CENTRAL, (info.create_system << 8) | 20, 20, flags,
+                                              info.compress_type, mtime, mdate, info.CRC, info.compress_size,
+                                              info.file_size, len(name), 0, 0, 0, info.internal_attr,
+                                              info.external_attr, local_offset) + name
+                count += 1
+
+            central_offset = dst.tell()
+            disk_writer.write_all(dst, central + END_FIXED.pack(END, 0, 0, count, count, len(central), central_offset, 0))
+        verify_file(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise